@@ -0,0 +1,31 @@
+#!/bin/bash
+# Initiates the single-node replica sets of the "sharded" compose profile
+# and registers the first INITIAL_SHARDS shards with mongos.
+set -e
+
+wait_for() {
+  until mongosh --quiet --host "$1" --eval "db.adminCommand('ping').ok" >/dev/null 2>&1; do
+    echo "waiting for $1..."
+    sleep 2
+  done
+}
+
+init_rs() {
+  # $1 host:port, $2 replica set name, $3 extra config (configsvr: true)
+  wait_for "$1"
+  mongosh --quiet --host "$1" --eval "
+    try { rs.status() } catch (e) {
+      rs.initiate({_id: '$2', $3 members: [{_id: 0, host: '$1'}]})
+    }"
+}
+
+init_rs configsvr:27019 cfgrs "configsvr: true,"
+for i in 1 2 3; do
+  init_rs shard$i:27018 shard${i}rs ""
+done
+
+wait_for mongos:27017
+for i in $(seq 1 "${INITIAL_SHARDS:-3}"); do
+  mongosh --quiet --host mongos:27017 --eval "sh.addShard('shard${i}rs/shard$i:27018')"
+done
+mongosh --quiet --host mongos:27017 --eval "sh.status()"
@@ -0,0 +1,30 @@
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from pymongo import ASCENDING
+
+# rough Piraeus port box, used when the piraeus_port layer is not loaded
+PIRAEUS_BOX = {"type": "Polygon", "coordinates": [[[23.56, 37.92], [23.66, 37.92], [23.66, 37.96], [23.56, 37.96], [23.56, 37.92]]]}
+
+def timed(fn, repeats):
+    # median wall time in ms
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(times), 2)
+
+def port_geometry(client):
+    port = client['piraeus_ais_db']['piraeus_port'].find_one({}, {"geometry": 1})
+    return port['geometry'] if port else PIRAEUS_BOX
+
+def query_sample(trips, n_vessels=50):
+    # same inputs for every run: 50 vessels (seeded) and the first day of data
+    vessels = trips.distinct("vessel_id")
+    sample = random.Random(42).sample(vessels, min(n_vessels, len(vessels)))
+    first = trips.find_one(sort=[("start_time", ASCENDING)], projection={"start_time": 1})
+    t0 = datetime.fromisoformat(first['start_time'])
+    window = {"$gte": t0.isoformat(), "$lt": (t0 + timedelta(days=1)).isoformat()}
+    return sample, window
@@ -0,0 +1,88 @@
+import argparse
+import json
+import time
+from pathlib import Path
+from pymongo import MongoClient, ASCENDING, GEOSPHERE
+from bench_common import port_geometry, query_sample, timed
+from config import MONGO_URI
+from sharding import SHARD_KEY, ShardRouter, list_shards, load_trips_by_shard, shard_trips
+
+BASE_DIR = Path(__file__).resolve().parent
+BENCH_DB = "ais_shard_bench"
+OUTPUT_JSON = BASE_DIR / "sharding_benchmark.json"
+
+def ensure_shards(client, shard_hosts, n):
+    # shards can only be added while scaling up, so the benchmark runs 1 -> N
+    present = set(list_shards(client))
+    for host in shard_hosts[:n]:
+        name = host.split("/")[0]
+        if name not in present:
+            print(f"Adding shard {host}...")
+            client.admin.command("addShard", host)
+
+def run_queries(client, db, repeats):
+    trips = db['trips']
+    sample, window = query_sample(trips)
+    port_geom = port_geometry(client)
+
+    return {
+        # shard key equality: routed to a single shard
+        "vessel_lookup_ms": timed(lambda: [list(trips.find({"vessel_id": v}, {"trajectory": 0})) for v in sample], repeats),
+        # no shard key: scatter-gather over every shard
+        "time_window_count_ms": timed(lambda: trips.count_documents({"start_time": window}), repeats),
+        "port_activity_ms": timed(lambda: len(trips.distinct("vessel_id", {
+            "start_time": window,
+            "trajectory.loc": {"$geoWithin": {"$geometry": port_geom}},
+        })), repeats),
+    }
+
+def benchmark(shard_hosts, trips_path, key, repeats):
+    client = MongoClient(MONGO_URI)
+    results = []
+    for n in range(1, len(shard_hosts) + 1):
+        ensure_shards(client, shard_hosts, n)
+        client.drop_database(BENCH_DB)
+        db = client[BENCH_DB]
+
+        shard_trips(client, BENCH_DB, key=key, trips_path=trips_path)
+        router = ShardRouter(client, BENCH_DB)
+        start = time.perf_counter()
+        count = load_trips_by_shard(db, trips_path, 'trips', router)
+        load_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        db['trips'].create_index([("vessel_id", ASCENDING), ("start_time", ASCENDING)])
+        db['trips'].create_index([("trajectory.loc", GEOSPHERE)])
+        index_s = time.perf_counter() - start
+
+        row = {
+            "shards": n,
+            "shard_key": key,
+            "trips": count,
+            "load_s": round(load_s, 2),
+            "load_trips_per_s": round(count / load_s, 1) if load_s else None,
+            "index_s": round(index_s, 2),
+            **run_queries(client, db, repeats),
+        }
+        print(row)
+        results.append(row)
+
+    with open(OUTPUT_JSON, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print(f"\n{'shards':>6}{'load s':>10}{'trips/s':>10}{'vessel ms':>11}{'window ms':>11}{'port ms':>10}")
+    for r in results:
+        print(f"{r['shards']:>6}{r['load_s']:>10}{r['load_trips_per_s']:>10}{r['vessel_lookup_ms']:>11}"
+              f"{r['time_window_count_ms']:>11}{r['port_activity_ms']:>10}")
+    print(f"Results saved to {OUTPUT_JSON.name}")
+    client.drop_database(BENCH_DB)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Trips load/query scaling from 1 to N shards (run against mongos)")
+    parser.add_argument("--shards", default="shard1rs/shard1:27018,shard2rs/shard2:27018,shard3rs/shard3:27018",
+                        help="comma list of shard connection strings, added one by one")
+    parser.add_argument("--trips", default=str(BASE_DIR / "trips_ready.json"))
+    parser.add_argument("--key", choices=["hashed", "ranged"], default=SHARD_KEY)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+    benchmark(args.shards.split(","), args.trips, args.key, args.repeats)
@@ -0,0 +1,121 @@
+import argparse
+import json
+import time
+from pathlib import Path
+from pymongo import MongoClient, ASCENDING, GEOSPHERE
+from bench_common import port_geometry, query_sample, timed
+from config import MONGO_URI
+
+BASE_DIR = Path(__file__).resolve().parent
+BENCH_DB = "ais_storage_bench"
+OUTPUT_JSON = BASE_DIR / "storage_benchmark.json"
+COMPRESSORS = ("snappy", "zstd", "zlib")
+# trips file and geo field of each document shape
+SCHEMAS = {
+    "full": (BASE_DIR / "trips_ready.json", "trajectory.loc"),
+    "compact": (BASE_DIR / "trips_compact.json", "g"),
+    "synopsis": (BASE_DIR / "trips_synopsis.json", "trajectory.loc"),
+    "synopsis_compact": (BASE_DIR / "trips_synopsis_compact.json", "g"),
+}
+
+def read_docs(path, limit=None):
+    docs = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip(): continue
+            doc = json.loads(line)
+            doc.pop('_id', None)
+            docs.append(doc)
+            if limit and len(docs) >= limit:
+                break
+    return docs
+
+def load(db, name, docs, compressor, geo_field, batch_size=1000):
+    db.drop_collection(name)
+    db.create_collection(name, storageEngine={"wiredTiger": {"configString": f"block_compressor={compressor}"}})
+    collection = db[name]
+    start = time.perf_counter()
+    for i in range(0, len(docs), batch_size):
+        # insert_many adds _id to the dicts, copies keep the shared docs clean for the next run
+        collection.insert_many([dict(d) for d in docs[i:i + batch_size]], ordered=False)
+    load_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    collection.create_index([("vessel_id", ASCENDING), ("start_time", ASCENDING)])
+    collection.create_index([(geo_field, GEOSPHERE)])
+    index_s = time.perf_counter() - start
+    return load_s, index_s
+
+def run_queries(db, name, geo_field, port_geom, repeats):
+    trips = db[name]
+    sample, window = query_sample(trips)
+    # any point in the port: $geoWithin on the point array, $geoIntersects on the MultiPoint
+    op = "$geoWithin" if geo_field == "trajectory.loc" else "$geoIntersects"
+
+    return {
+        # whole documents, so every trip is read and decompressed
+        "vessel_trips_ms": timed(lambda: [list(trips.find({"vessel_id": v})) for v in sample], repeats),
+        "port_activity_ms": timed(lambda: len(trips.distinct("vessel_id", {
+            "start_time": window,
+            geo_field: {op: {"$geometry": port_geom}},
+        })), repeats),
+        "full_scan_ms": timed(lambda: trips.count_documents({"point_count": {"$gte": 0}}), repeats),
+    }
+
+def benchmark(schemas, compressors, limit, repeats):
+    client = MongoClient(MONGO_URI)
+    client.drop_database(BENCH_DB)
+    db = client[BENCH_DB]
+    cache_bytes = client.admin.command("serverStatus")["wiredTiger"]["cache"]["maximum bytes configured"]
+    port_geom = port_geometry(client)
+
+    results = []
+    for schema in schemas:
+        path, geo_field = SCHEMAS[schema]
+        if not path.exists():
+            print(f"! {path.name} not found, skipping the {schema} schema")
+            continue
+        docs = read_docs(path, limit)
+        print(f"\n{schema}: {len(docs):,} trips from {path.name}")
+        for compressor in compressors:
+            name = f"trips_{schema}_{compressor}"
+            load_s, index_s = load(db, name, docs, compressor, geo_field)
+            stats = db.command("collStats", name)
+            row = {
+                "schema": schema,
+                "compressor": compressor,
+                "trips": stats['count'],
+                "load_s": round(load_s, 2),
+                "index_s": round(index_s, 2),
+                "bson_mb": round(stats['size'] / 1024 / 1024, 2),
+                "storage_mb": round(stats['storageSize'] / 1024 / 1024, 2),
+                "index_mb": round(stats['totalIndexSize'] / 1024 / 1024, 2),
+                "avg_doc_kb": round(stats.get('avgObjSize', 0) / 1024, 2),
+                # uncompressed BSON is what has to fit in the WiredTiger cache
+                "cache_ratio": round(stats['size'] / cache_bytes, 3),
+                **run_queries(db, name, geo_field, port_geom, repeats),
+            }
+            print(row)
+            results.append(row)
+            db.drop_collection(name)
+
+    with open(OUTPUT_JSON, "w") as f:
+        json.dump({"cache_mb": round(cache_bytes / 1024 / 1024, 1), "results": results}, f, indent=2)
+
+    print(f"\nWiredTiger cache: {cache_bytes / 1024 / 1024:,.0f} MB")
+    print(f"{'schema':<18}{'compr':<8}{'load s':>8}{'bson MB':>10}{'disk MB':>10}{'idx MB':>9}{'cache':>7}"
+          f"{'vessel ms':>11}{'port ms':>10}{'scan ms':>10}")
+    for r in results:
+        print(f"{r['schema']:<18}{r['compressor']:<8}{r['load_s']:>8}{r['bson_mb']:>10}{r['storage_mb']:>10}{r['index_mb']:>9}"
+              f"{r['cache_ratio']:>7}{r['vessel_trips_ms']:>11}{r['port_activity_ms']:>10}{r['full_scan_ms']:>10}")
+    print(f"Results saved to {OUTPUT_JSON.name}")
+    client.drop_database(BENCH_DB)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Trips size, load time and query latency per document shape and block compressor")
+    parser.add_argument("--schemas", default=",".join(SCHEMAS), help="comma list of: " + ", ".join(SCHEMAS) + " (missing files are skipped)")
+    parser.add_argument("--compressors", default=",".join(COMPRESSORS))
+    parser.add_argument("--limit", type=int, help="only the first N trips of each file")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+    benchmark(args.schemas.split(","), args.compressors.split(","), args.limit, args.repeats)
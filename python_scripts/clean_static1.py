@@ -1,6 +1,9 @@
 import os
 from pathlib import Path
 import pandas as pd
+from metrics import RunMetrics
+
+run = RunMetrics("clean_static1")
 
 BASE_DIR = Path(__file__).resolve().parent
 DATA_DIR = BASE_DIR / "data"
@@ -9,8 +12,10 @@ PATH_STATIC = DATA_DIR / "ais_static" / "ais_static" / "unipi_ais_static.csv"
 PATH_DESCRIPTION = DATA_DIR / "ais_static" / "ais_static" / "ais_codes_descriptions.csv"
 
 OUTPUT_PATH = "static.csv"
-df_static = pd.read_csv(PATH_STATIC)
-df_description = pd.read_csv(PATH_DESCRIPTION)
+with run.stage("load"), run.io():
+    df_static = pd.read_csv(PATH_STATIC)
+    df_description = pd.read_csv(PATH_DESCRIPTION)
+    run.rows(len(df_static))
 
 print("First rows of static:")
 print(df_static.head())
@@ -38,7 +43,9 @@ print("Description missing values:\n", df_description.isnull().sum())
 
 
 # Left join keeps every vessel row, even if a shiptype code has no match.
-vessels_df = pd.merge(df_static, df_description, left_on="shiptype", right_on="Type Code",how="left",)
+with run.stage("join"):
+    vessels_df = pd.merge(df_static, df_description, left_on="shiptype", right_on="Type Code",how="left",)
+    run.rows(len(vessels_df))
 
 # If a shiptype code is not found in the dictionary, Description becomes NaN.
 missing_desc = vessels_df["Description"].isna().sum()
@@ -63,8 +70,10 @@ print("vessel_id appearing multiple times:", f"{len(dup_ids):,}")
 #helper flag used only for sorting preference
 vessels_df["is_unknown"] = vessels_df["Description"].apply(lambda x: 1 if x in ("Unknown Type", "Not available (default)") else 0)
 # Sort so the preferred row per vessel_id comes first, then keep the first
-vessels_df = vessels_df.sort_values(by=["vessel_id", "is_unknown"])
-vessels_df_clean = vessels_df.drop_duplicates(subset=["vessel_id"], keep="first")
+with run.stage("dedup"):
+    vessels_df = vessels_df.sort_values(by=["vessel_id", "is_unknown"])
+    vessels_df_clean = vessels_df.drop_duplicates(subset=["vessel_id"], keep="first")
+    run.rows(len(vessels_df))
 
 #drop helper/join columns that we don't want in the output
 drop_cols = [c for c in ["is_unknown", "Type Code"] if c in vessels_df_clean.columns]
@@ -74,9 +83,13 @@ vessels_df_clean = vessels_df_clean.drop(columns=drop_cols)
 if os.path.exists(OUTPUT_PATH):
     os.remove(OUTPUT_PATH)
 
-vessels_df_clean.to_csv(OUTPUT_PATH, index=False)
+with run.stage("save"), run.io():
+    vessels_df_clean.to_csv(OUTPUT_PATH, index=False)
+    run.rows(len(vessels_df_clean))
 
 print("Export finished.")
 print("  joined rows: ", f"{len(vessels_df):,}")
 print("  unique rows: ", f"{len(vessels_df_clean):,}")
 print("  file:       ", OUTPUT_PATH)
+
+run.finish()
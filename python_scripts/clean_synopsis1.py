@@ -3,6 +3,9 @@ import os
 import glob
 from pathlib import Path
 import pandas as pd
+from metrics import RunMetrics
+
+run = RunMetrics("clean_synopsis1")
 
 BASE_DIR = Path(__file__).resolve().parent
 DATA_DIR = BASE_DIR / "data"
@@ -29,51 +32,62 @@ print("Synopsis files:", len(files))
 print("Sample:", ", ".join(os.path.basename(f) for f in files[:3]))
 
 # Load + concat 
-parts = []
-for f in files:
-    parts.append(pd.read_csv(f, low_memory=False))
-
-df = pd.concat(parts, ignore_index=True)
-del parts
-gc.collect()
+with run.stage("load"):
+    parts = []
+    for f in files:
+        with run.stage("read_csv"), run.io():
+            parts.append(pd.read_csv(f, low_memory=False))
+            run.rows(len(parts[-1]))
+
+    with run.stage("concat"):
+        df = pd.concat(parts, ignore_index=True)
+        del parts
+        gc.collect()
+        run.rows(len(df))
 
 print("Raw rows:", f"{len(df):,}")
 
-# Timestamp cleanup
-df["t"] = pd.to_datetime(df["t"], unit="ms", errors="coerce")
-bad_ts = df["t"].isna().sum()
-if bad_ts:
-    df = df[df["t"].notna()].copy()
-    print("Dropped bad timestamps:", f"{bad_ts:,}")
+with run.stage("clean"):
+    run.rows(len(df))
+    # Timestamp cleanup
+    df["t"] = pd.to_datetime(df["t"], unit="ms", errors="coerce")
+    bad_ts = df["t"].isna().sum()
+    if bad_ts:
+        df = df[df["t"].notna()].copy()
+        print("Dropped bad timestamps:", f"{bad_ts:,}")
 
-# Keep 2019 Jan–Mar (even if filenames already filter months)
-df = df[(df["t"].dt.year == 2019) & (df["t"].dt.month.isin([1, 2, 3]))].copy()
+    # Keep 2019 Jan–Mar (even if filenames already filter months)
+    df = df[(df["t"].dt.year == 2019) & (df["t"].dt.month.isin([1, 2, 3]))].copy()
 
-# Remove exact duplicates, then resolve conflicts on (vessel_id, t)
-before = len(df)
-df.drop_duplicates(inplace=True)
-print("Exact dups removed:", f"{before - len(df):,}")
+    # Remove exact duplicates, then resolve conflicts on (vessel_id, t)
+    before = len(df)
+    df.drop_duplicates(inplace=True)
+    print("Exact dups removed:", f"{before - len(df):,}")
 
-if "vessel_id" not in df.columns:
-    raise KeyError("Column 'vessel_id' not found")
+    if "vessel_id" not in df.columns:
+        raise KeyError("Column 'vessel_id' not found")
 
-df.sort_values(by=["vessel_id", "t"], inplace=True)
-before = len(df)
-df.drop_duplicates(subset=["vessel_id", "t"], keep="first", inplace=True)
-print("Conflicts removed (vessel_id,t):", f"{before - len(df):,}")
+    df.sort_values(by=["vessel_id", "t"], inplace=True)
+    before = len(df)
+    df.drop_duplicates(subset=["vessel_id", "t"], keep="first", inplace=True)
+    print("Conflicts removed (vessel_id,t):", f"{before - len(df):,}")
 
-# string formatting on purpose
-for c in ("lat", "lon"):
-    if c in df.columns:
-        df[c] = df[c].apply(lambda x: f"{x:.5f}" if pd.notnull(x) else "")
+    # string formatting on purpose
+    for c in ("lat", "lon"):
+        if c in df.columns:
+            df[c] = df[c].apply(lambda x: f"{x:.5f}" if pd.notnull(x) else "")
 
-for c in ("speed", "course", "heading"):
-    if c in df.columns:
-        df[c] = df[c].apply(lambda x: f"{x:.2f}" if pd.notnull(x) else "")
+    for c in ("speed", "course", "heading"):
+        if c in df.columns:
+            df[c] = df[c].apply(lambda x: f"{x:.2f}" if pd.notnull(x) else "")
 
 if os.path.exists(OUTPUT_PATH):
     os.remove(OUTPUT_PATH)
 
-df.to_csv(OUTPUT_PATH, index=False)
+with run.stage("save"), run.io():
+    df.to_csv(OUTPUT_PATH, index=False)
+    run.rows(len(df))
 
 print("Saved:", OUTPUT_PATH, "| rows:", f"{len(df):,}")
+
+run.finish()
@@ -0,0 +1,5 @@
+import os
+
+# every script connects through this, so one export moves the whole pipeline (mongos of the
+# "sharded" compose profile listens on 27030)
+MONGO_URI = os.environ.get("AIS_MONGO_URI", "mongodb://localhost:27017/")
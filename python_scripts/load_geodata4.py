@@ -1,17 +1,94 @@
 import geopandas as gpd
 import os
-import json
-import pandas as pd
+import time
+from concurrent.futures import ThreadPoolExecutor
+from shapely.geometry import GeometryCollection, MultiPolygon, Polygon
 from pymongo import MongoClient, GEOSPHERE
 from pathlib import Path
+from metrics import RunMetrics
+from config import MONGO_URI
+
+run = RunMetrics("load_geodata4")
+
+# simplification tolerance in degrees (0 = keep original rings), ~0.0001 deg is ~10 m
+SIMPLIFY_TOLERANCE = float(os.environ.get("GEO_SIMPLIFY_TOLERANCE", 0))
+# opt-in repair of self-intersecting rings (2dsphere indexes reject invalid polygons),
+# it rewrites the stored geometry and drops stray line/point parts
+MAKE_VALID = os.environ.get("GEO_MAKE_VALID", "0") == "1"
+MAX_WORKERS = 5
+
+def polygonal_part(geom):
+    # make_valid can return a GeometryCollection with stray lines/points, keep the area
+    if isinstance(geom, GeometryCollection):
+        polys = []
+        for g in geom.geoms:
+            if isinstance(g, Polygon):
+                polys.append(g)
+            elif isinstance(g, MultiPolygon):
+                polys.extend(g.geoms)
+        if polys:
+            return polys[0] if len(polys) == 1 else MultiPolygon(polys)
+    return geom
+
+def prepare_geometries(gdf, col_name=""):
+    geoms = gdf.geometry
+    invalid = ~geoms.is_valid
+    if invalid.any():
+        if MAKE_VALID:
+            geoms = geoms.copy()
+            geoms[invalid] = geoms[invalid].make_valid().apply(polygonal_part)
+            print(f"  Repaired {invalid.sum()} invalid features in '{col_name}'.")
+        else:
+            print(f"  {invalid.sum()} invalid features in '{col_name}' stored as is (GEO_MAKE_VALID=1 repairs them).")
+    if SIMPLIFY_TOLERANCE > 0:
+        geoms = geoms.simplify(SIMPLIFY_TOLERANCE, preserve_topology=True)
+    return geoms
+
+def build_documents(gdf, col_name=""):
+    # properties: NaN -> None for the whole frame at once
+    props = gdf.drop(columns='geometry')
+    props = props.astype(object).where(props.notna(), None).to_dict('records')
+    # the whole GeoSeries as GeoJSON mappings, no per-polygon json dumps/loads
+    features = prepare_geometries(gdf, col_name).__geo_interface__['features']
+    return [{"properties": p, "geometry": f['geometry']} for p, f in zip(props, features)]
+
+def load_layer(db, col_name, file_path):
+    timings = {}
+    # read spatial data with Greek values
+    # cp1253 is the standard for Greek Shapefiles
+    t0 = time.perf_counter()
+    gdf = gpd.read_file(file_path, encoding='cp1253')
+    timings["read_shapefile"] = (time.perf_counter() - t0, len(gdf), True)
+
+    #convert to WGS84 (EPSG:4326) for MongoDB compatibility
+    t0 = time.perf_counter()
+    if gdf.crs != "EPSG:4326":
+        gdf = gdf.to_crs(epsg=4326)
+    data = build_documents(gdf, col_name)
+    timings["build_docs"] = (time.perf_counter() - t0, len(data), False)
+
+    # drop old collection and insert new data
+    if data:
+        t0 = time.perf_counter()
+        db[col_name].drop()
+        db[col_name].insert_many(data)
+        timings["insert"] = (time.perf_counter() - t0, len(data), True)
+        print(f"  Successfully inserted {len(data)} features into '{col_name}'.")
+
+        # Create 2dsphere index for spatial queries (Intersect, Within, etc.)
+        t0 = time.perf_counter()
+        db[col_name].create_index([("geometry", GEOSPHERE)])
+        timings["index"] = (time.perf_counter() - t0, 0, True)
+        print(f"  Spatial index created for '{col_name}'.")
+    return timings
 
 def load_geodata():
     BASE_DIR = Path(__file__).resolve().parent
     GEO_BASE = BASE_DIR / "data" / "geodata"
-    
-    client = MongoClient('mongodb://localhost:27017/')
+
+    client = MongoClient(MONGO_URI)
     db = client['piraeus_ais_db']
-    
+
     layers = [
         ("harbours", GEO_BASE / "harbours" / "harbours.shp"),
         ("islands", GEO_BASE / "islands" / "islands.shp"),
@@ -19,7 +96,8 @@ def load_geodata():
         ("regions", GEO_BASE / "regions" / "regions.shp"),
         ("territorial_waters", GEO_BASE / "territorial_waters" / "saronic_territorial_waters.shp")
     ]
-    
+
+    jobs = []
     for col_name, file_path in layers:
         # Check if shapefile exists. If not, fallback to .dbf
         if not file_path.exists():
@@ -29,44 +107,25 @@ def load_geodata():
             else:
                 print(f"! Skipping {col_name}: File not found at {file_path}")
                 continue
-                
-        print(f"-> Processing {col_name}...")
-        
-        try:
-            # read spatial data with Greek values
-            # cp1253 is the standard for Greek Shapefiles
-            gdf = gpd.read_file(file_path, encoding='cp1253')
-            
-            #convert to WGS84 (EPSG:4326) for MongoDB compatibility
-            if gdf.crs != "EPSG:4326":
-                gdf = gdf.to_crs(epsg=4326)
-                
-            data = []
-            for _, row in gdf.iterrows():
-                #handle properties and convert NaNs to None (null)
-                props = row.drop('geometry').to_dict()
-                props = {k: (v if not pd.isna(v) else None) for k, v in props.items()}
-                
-                # now we onvert geometry to GeoJSON format
-                geom = json.loads(json.dumps(row.geometry.__geo_interface__))
-                
-                doc = {
-                    "properties": props,
-                    "geometry": geom
-                }
-                data.append(doc)
-            # drop old collection and insert new data 
-            if data:
-                db[col_name].drop() 
-                db[col_name].insert_many(data)
-                print(f"  Successfully inserted {len(data)} features into '{col_name}'.")
-                
-                # Create 2dsphere index for spatial queries (Intersect, Within, etc.)
-                db[col_name].create_index([("geometry", GEOSPHERE)])
-                print(f"  Spatial index created for '{col_name}'.")
-                
-        except Exception as e:
-            print(f"  Error loading {col_name}: {e}")
+        jobs.append((col_name, file_path))
+
+    # layers are independent collections, load them side by side
+    with run.stage("layers"), ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        futures = {}
+        for col_name, file_path in jobs:
+            print(f"-> Processing {col_name}...")
+            futures[col_name] = pool.submit(load_layer, db, col_name, file_path)
+
+        for col_name, future in futures.items():
+            try:
+                timings = future.result()
+            except Exception as e:
+                print(f"  Error loading {col_name}: {e}")
+                continue
+            # timings are collected per thread, RunMetrics itself is not thread-safe
+            for step, (seconds, rows, is_io) in timings.items():
+                run.record(f"{col_name}/{step}", seconds, rows=rows, io=is_io)
 
 if __name__ == "__main__":
-    load_geodata()
\ No newline at end of file
+    load_geodata()
+    run.finish()
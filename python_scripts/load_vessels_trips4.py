@@ -3,11 +3,91 @@ import os
 import time
 import sys
 from pymongo import MongoClient
+from metrics import RunMetrics
+from config import MONGO_URI
+from sharding import ShardRouter, is_mongos, load_trips_by_shard, shard_trips
+from query_cache import mark_windows_dirty, windows_touching
+
+run = RunMetrics("load_vessels_trips4")
+
+def load_trips(db, path, collection_name):
+    collection = db[collection_name]
+    print(f"\nLoading {collection_name}...")
+    t_count = 0
+    rejected_count = 0
+    t_chunk = []
+    chunk_size = 1000
+    parse_s = insert_s = 0.0
+    touched = set()  # query-cache sub-windows covered by the new trips
+    
+    with run.stage(collection_name), open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip(): continue
+            try:
+                t0 = time.perf_counter()
+                doc = json.loads(line)
+                doc.pop('_id', None) 
+                t_chunk.append(doc)
+                touched.update(windows_touching(doc['start_time'], doc['end_time']))
+                parse_s += time.perf_counter() - t0
+                
+                if len(t_chunk) >= chunk_size:
+                    t0 = time.perf_counter()
+                    try:
+                        # Bulk insertion for speed
+                        collection.insert_many(t_chunk, ordered=False)
+                        t_count += len(t_chunk)
+                    except Exception:
+                        # Fallback if chunk fails
+                        for d in t_chunk:
+                            try:
+                                collection.insert_one(d)
+                                t_count += 1
+                            except: rejected_count += 1
+                    insert_s += time.perf_counter() - t0
+                    
+                    print(f"Progress: {t_count:,} {collection_name} inserted...")
+                    t_chunk = []
+            except Exception as e:
+                print(f"Skip line error: {e}")
+
+        # Final chunk processing
+        if t_chunk:
+            t0 = time.perf_counter()
+            for d in t_chunk:
+                try:
+                    collection.insert_one(d)
+                    t_count += 1
+                except: rejected_count += 1
+            insert_s += time.perf_counter() - t0
+        run.rows(t_count)
+        run.record("json_parse", parse_s, rows=t_count + rejected_count)
+        run.record("insert", insert_s, rows=t_count, io=True)
+
+    print(f"FINISH: {t_count:,} inserted, {rejected_count:,} rejected.")
+    if collection_name == 'trips':
+        mark_windows_dirty(db, touched)
+    return t_count
+
+def load_weather_slots(db, path, collection_name='weather_slots'):
+    # the weather lookup the trips were enriched with, keyed like the compact trips reference it
+    with run.stage(collection_name), run.io():
+        with open(path, 'r', encoding='utf-8') as f:
+            lookup = json.load(f)
+        docs = []
+        for key, fields in lookup.items():
+            cell_id, slot = key.split('_')
+            docs.append({"_id": key, "cell_id": int(cell_id), "slot": int(slot), **{k: v for k, v in fields.items() if v is not None}})
+        for i in range(0, len(docs), 5000):
+            db[collection_name].insert_many(docs[i:i + 5000], ordered=False)
+        run.rows(len(docs))
+    print(f"Successfully inserted {len(docs):,} weather slots.")
+    return len(docs)
 
 def load_data():
     try:
-        # connect to local MongoDB server
-        client = MongoClient('mongodb://localhost:27017/', serverSelectionTimeoutMS=5000)
+        # connect to local MongoDB server (or the mongos of a sharded cluster)
+        client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
         db_name = 'piraeus_ais_db'
         db = client[db_name]
         
@@ -27,73 +107,66 @@ def load_data():
         print(f"Connection or Reset failed: {e}")
         return
 
+    # sharded cluster: shard + pre-split trips while it is still empty
+    router = None
+    if is_mongos(client) and os.path.exists('trips_ready.json'):
+        with run.stage("shard_trips"), run.io():
+            shard_trips(client, db_name, trips_path='trips_ready.json')
+            router = ShardRouter(client, db_name)
+
     # 3. LOADING VESSELS (Chunked for Memory Safety)
     if os.path.exists('vessels_ready.json'):
         v_count = 0
         v_chunk = []
-        with open('vessels_ready.json', 'r', encoding='utf-8') as f:
+        parse_s = insert_s = 0.0
+        with run.stage("vessels"), open('vessels_ready.json', 'r', encoding='utf-8') as f:
             for line in f:
                 if line.strip():
                     try:
+                        t0 = time.perf_counter()
                         doc = json.loads(line)
                         doc.pop('_id', None) 
                         v_chunk.append(doc)
+                        parse_s += time.perf_counter() - t0
                         if len(v_chunk) >= 1000:
+                            t0 = time.perf_counter()
                             db.vessels.insert_many(v_chunk, ordered=False)
+                            insert_s += time.perf_counter() - t0
                             v_count += len(v_chunk)
                             v_chunk = []
                     except: continue
             if v_chunk:
+                t0 = time.perf_counter()
                 db.vessels.insert_many(v_chunk, ordered=False)
+                insert_s += time.perf_counter() - t0
                 v_count += len(v_chunk)
+            run.rows(v_count)
+            run.record("json_parse", parse_s, rows=v_count)
+            run.record("insert", insert_s, rows=v_count, io=True)
         print(f"Successfully inserted {v_count:,} vessels.")
 
     # 4. LOADING TRIPS (Chunked Loading)
     if os.path.exists('trips_ready.json'):
-        print("\nLoading Trips...")
-        t_count = 0
-        rejected_count = 0
-        t_chunk = []
-        chunk_size = 1000
-        
-        with open('trips_ready.json', 'r', encoding='utf-8') as f:
-            for line in f:
-                if not line.strip(): continue
-                try:
-                    doc = json.loads(line)
-                    doc.pop('_id', None) 
-                    t_chunk.append(doc)
-                    
-                    if len(t_chunk) >= chunk_size:
-                        try:
-                            # Bulk insertion for speed
-                            db.trips.insert_many(t_chunk, ordered=False)
-                            t_count += len(t_chunk)
-                        except Exception:
-                            # Fallback if chunk fails
-                            for d in t_chunk:
-                                try:
-                                    db.trips.insert_one(d)
-                                    t_count += 1
-                                except: rejected_count += 1
-                        
-                        print(f"Progress: {t_count:,} trips inserted...")
-                        t_chunk = []
-                except Exception as e:
-                    print(f"Skip line error: {e}")
+        if router is not None:
+            load_trips_by_shard(db, 'trips_ready.json', 'trips', router, run=run)
+        else:
+            load_trips(db, 'trips_ready.json', 'trips')
 
-            # Final chunk processing
-            if t_chunk:
-                for d in t_chunk:
-                    try:
-                        db.trips.insert_one(d)
-                        t_count += 1
-                    except: rejected_count += 1
+    # synopsis-based trips (process_final_trips3.py --mode synopsis) go to their own collection
+    if os.path.exists('trips_synopsis.json'):
+        load_trips(db, 'trips_synopsis.json', 'trips_synopsis')
 
-        print(f"FINISH: {t_count:,} inserted, {rejected_count:,} rejected.")
+    # compact trips (process_final_trips3.py --compact) reference weather by (cell_id, slot)
+    if os.path.exists('trips_compact.json'):
+        load_trips(db, 'trips_compact.json', 'trips_compact')
+    if os.path.exists('trips_synopsis_compact.json'):
+        load_trips(db, 'trips_synopsis_compact.json', 'trips_synopsis_compact')
+    if (os.path.exists('trips_compact.json') or os.path.exists('trips_synopsis_compact.json')) and os.path.exists('weather_data.json'):
+        load_weather_slots(db, 'weather_data.json')
 
     print(f"  -> Vessels: {db.vessels.count_documents({}):,}")
     print(f"  -> Trips:   {db.trips.count_documents({}):,}")
 
 if __name__ == "__main__":
-    load_data()
\ No newline at end of file
+    load_data()
+    run.finish()
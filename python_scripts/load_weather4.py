@@ -2,99 +2,152 @@ import geopandas as gpd
 import pandas as pd
 import json
 import os
-from datetime import datetime, timezone
-from pathlib import Path
-from pymongo import MongoClient
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pymongo import MongoClient, ASCENDING
+from metrics import RunMetrics
+from config import MONGO_URI
+# same month list and station ids as the AIS enrichment
+from weather_with_dynamic2 import SHP_FILES, STATIONS_JSON
+
+run = RunMetrics("load_weather4")
+
+BATCH_SIZE = 5000
+MAX_WORKERS = 4
+
+def coord_keys(gdf):
+    # same key as weather_with_dynamic2.py (5 decimals lon_lat)
+    return pd.Series([f"{x:.5f}_{y:.5f}" for x, y in zip(gdf.geometry.x, gdf.geometry.y)], index=gdf.index)
+
+def station_cell_ids(gdf):
+    # reuse the ids the AIS points were enriched with, so trips and weather join on cell_id
+    if STATIONS_JSON.exists():
+        with open(STATIONS_JSON, "r") as f:
+            stations = json.load(f)
+        coord_map = {f"{s['lon']:.5f}_{s['lat']:.5f}": s['cell_id'] for s in stations}
+    else:
+        # same first-seen order over the concatenated months as weather_with_dynamic2.py
+        print(f"! {STATIONS_JSON.name} not found, deriving cell_ids from the shapefiles")
+        coord_map = {key: i for i, key in enumerate(pd.unique(gdf['coord_key']))}
+    return gdf['coord_key'].map(coord_map)
+
+def build_documents(gdf):
+    # column-wise: every attribute is converted once per column, not once per cell
+    attr_cols = [c for c in gdf.columns if c not in ('geometry', 'coord_key', 'cell_id')]
+    columns = {}
+    for col in attr_cols:
+        series = gdf[col]
+        if not pd.api.types.is_datetime64_any_dtype(series):
+            numeric = pd.to_numeric(series, errors='coerce')
+            # keep text columns as text, same rule as the old per-field try/float
+            if numeric.notna().sum() == series.notna().sum():
+                series = numeric
+            else:
+                series = series.astype(str).where(series.notna())
+        columns[col] = series
+    attrs = pd.DataFrame(columns, index=gdf.index)
+
+    # unit conversion: Kelvin to Celsius
+    if 'TMP' in attrs.columns:
+        attrs['temp_c'] = (attrs['TMP'] - 273.15).round(2)
+
+    ts_unix = gdf['timestamp_'].astype('int64').to_numpy()
+    timestamps = pd.to_datetime(ts_unix, unit='s', utc=True).to_pydatetime()
+    lons = gdf.geometry.x.to_numpy()
+    lats = gdf.geometry.y.to_numpy()
+    cell_ids = gdf['cell_id'].astype('int64').to_numpy()
+
+    # NaN -> None once, then drop the None fields per document
+    attr_values = attrs.astype(object).where(attrs.notna(), None)
+    names = list(attr_values.columns)
+    docs = []
+    for i, values in enumerate(attr_values.itertuples(index=False, name=None)):
+        docs.append({
+            "metadata": {"cell_id": int(cell_ids[i])},
+            "timestamp": timestamps[i],
+            "timestamp_unix": int(ts_unix[i]),
+            "location": {"type": "Point", "coordinates": [float(lons[i]), float(lats[i])]},
+            "weather_attributes": {k: v for k, v in zip(names, values) if v is not None}
+        })
+    return docs
+
+def insert_batches(collection, docs, batch_size=BATCH_SIZE, max_workers=MAX_WORKERS):
+    # at most max_workers batches in flight, so memory on both sides stays bounded
+    inserted = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending = set()
+        for start in range(0, len(docs), batch_size):
+            if len(pending) >= max_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                inserted += sum(len(f.result().inserted_ids) for f in done)
+            pending.add(pool.submit(collection.insert_many, docs[start:start + batch_size], ordered=False))
+        for f in pending:
+            inserted += len(f.result().inserted_ids)
+    return inserted
 
 def load_weather_collection():
-    BASE_DIR = Path(__file__).resolve().parent
-    DATA_DIR = BASE_DIR / "data" 
-    shp_path = DATA_DIR / "noaa_weather" / "noaa_weather" / "2019" / "jan" / "noaa_weather_jan2019_v2.shp"
-    
     # 2. MongoDB Connection
-    client = MongoClient('mongodb://localhost:27017/')
+    client = MongoClient(MONGO_URI)
     db = client['piraeus_ais_db']
-    collection = db['weather']
-    
-    if not shp_path.exists():
-        print(f"Error: File NOT found at: {shp_path}")
+
+    parts = []
+    for shp_path in SHP_FILES:
+        if not shp_path.exists():
+            print(f"! Missing: {shp_path}")
+            continue
+        print(f"Reading Shapefile: {shp_path.name}")
+        with run.stage("read_shapefile"), run.io():
+            gdf_tmp = gpd.read_file(shp_path)
+            run.rows(len(gdf_tmp))
+        # Ensure coordinates are in WGS84
+        if gdf_tmp.crs != "EPSG:4326":
+            gdf_tmp = gdf_tmp.to_crs(epsg=4326)
+        parts.append(gdf_tmp)
+
+    if not parts:
+        print("Error: no weather shapefiles found!")
         return
-        
-    print(f"Reading Shapefile: {shp_path.name}")
-    
+
     try:
-        # load data with Geopandas
-        gdf = gpd.read_file(shp_path)
-        
-        # Ensure coordinates are in WGS84
-        if gdf.crs != "EPSG:4326":
-            gdf = gdf.to_crs(epsg=4326)
-            
-        print(f"File loaded. Processing {len(gdf):,} records...")
-        
+        gdf = pd.concat(parts, ignore_index=True)
+        del parts
+        print(f"Files loaded. Processing {len(gdf):,} records...")
+
         # 3.map coordinates to Cell IDs
-        gdf['coord_str'] = gdf.geometry.apply(lambda geom: f"{geom.x:.5f}_{geom.y:.5f}")
-        unique_coords = sorted(gdf['coord_str'].unique())
-        coord_map = {val: i for i, val in enumerate(unique_coords)}
-        gdf['cell_id'] = gdf['coord_str'].map(coord_map)
-        
+        with run.stage("cell_ids"):
+            gdf['coord_key'] = coord_keys(gdf)
+            gdf['cell_id'] = station_cell_ids(gdf)
+            gdf = gdf[gdf['timestamp_'].notna() & gdf['cell_id'].notna()]
+            run.rows(len(gdf))
+
         # 4. Prepare MongoDB Documents
-        data = []
-        for _, row in gdf.iterrows():
-            ts_val = row.get('timestamp_')
-            if pd.isna(ts_val):
-                continue
-                
-            ts_val = int(ts_val)
-            dt_object = datetime.fromtimestamp(ts_val, tz=timezone.utc)
-            
-            # Clean attributes and handle NaNs
-            props = row.drop(['geometry', 'coord_str', 'cell_id']).to_dict()
-            cleaned_props = {}
-            for k, v in props.items():
-                if pd.notna(v):
-                    if isinstance(v, (pd.Timestamp, datetime)):
-                        cleaned_props[k] = v
-                    else:
-                        try:
-                            cleaned_props[k] = float(v)
-                        except:
-                            cleaned_props[k] = str(v)
-            
-            # unit conversion: Kelvin to Celsius
-            if 'TMP' in cleaned_props:
-                cleaned_props['temp_c'] = round(cleaned_props['TMP'] - 273.15, 2)
-            
-            # define GeoJSON point
-            geom = {
-                "type": "Point",
-                "coordinates": [row.geometry.x, row.geometry.y]
-            }
-            
-            doc = {
-                "metadata": {
-                    "cell_id": int(row['cell_id']),
-                    "timestamp_unix": ts_val
-                },
-                "timestamp": dt_object,
-                "location": geom,
-                "weather_attributes": cleaned_props
-            }
-            data.append(doc)
-            
-        # 5. insert data into MongoDB
+        with run.stage("build_docs"):
+            data = build_documents(gdf)
+            run.rows(len(data))
+
+        # 5. insert data into a time-series collection (one series per station)
         if data:
             print("Dropping old weather collection...")
-            collection.drop()
-            
+            db['weather'].drop()
+            db.create_collection('weather', timeseries={
+                "timeField": "timestamp",
+                "metaField": "metadata",
+                "granularity": "hours"
+            })
+            collection = db['weather']
+
             print(f"Inserting {len(data):,} weather documents...")
-            collection.insert_many(data)
-            print("Insert complete.")
-            
+            with run.stage("insert"), run.io():
+                inserted = insert_batches(collection, data)
+                run.rows(inserted)
+            with run.stage("index"), run.io():
+                collection.create_index([("metadata.cell_id", ASCENDING), ("timestamp", ASCENDING)])
+            print(f"Insert complete ({inserted:,} documents).")
+
     except Exception as e:
         print(f"Error loading weather: {e}")
         import traceback
         traceback.print_exc()
 
 if __name__ == "__main__":
-    load_weather_collection()
\ No newline at end of file
+    load_weather_collection()
+    run.finish()
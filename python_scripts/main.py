@@ -2,30 +2,43 @@ import subprocess
 import sys
 import time
 
+import metrics
+
 def run_script(script_name):
     start_time = time.time()
     try:
         process = subprocess.run([sys.executable, script_name], check=True)
         end_time = time.time()
         print(f"\nFINISHED: {script_name} in {end_time - start_time:.2f} seconds.")
+        return end_time - start_time
     except subprocess.CalledProcessError as e:
         print(f"\n[ERROR] Script {script_name} failed with exit code {e.returncode}")
         sys.exit(1)
 
 def main():
     pipeline_start = time.time()
-    run_script("clean_static1.py")  # we run each script sequentially
-    run_script("clean_dynamic1.py")
-    run_script("clean_synopsis1.py")
-    run_script("process_vessels3.py")
-    run_script("weather_with_dynamic2.py")
-    run_script("process_final_trips3.py")
-    run_script("load_vessels_trips4.py")
-    run_script("load_weather4.py")
-    run_script("load_geodata4.py")
+    # fresh run report, every script merges its own stages into it
+    metrics.write_report({"pipeline_started": pipeline_start, "scripts": {}})
+
+    wall = {}
+    for script in ("clean_static1.py",  # we run each script sequentially
+                   "clean_dynamic1.py",
+                   "clean_synopsis1.py",
+                   "process_vessels3.py",
+                   "weather_with_dynamic2.py",
+                   "process_final_trips3.py",
+                   "load_vessels_trips4.py",
+                   "load_weather4.py",
+                   "load_geodata4.py"):
+        wall[script] = run_script(script)
 
     total_time = time.time() - pipeline_start
+    report = metrics.load_report()
+    report["script_wall_seconds"] = {k: round(v, 3) for k, v in wall.items()}
+    report["pipeline_seconds"] = round(total_time, 3)
+    metrics.write_report(report)
     print(f"PIPELINE COMPLETED SUCCESSFULLY IN {total_time/60:.2f} MINUTES")
+    print(f"Run report: {metrics.REPORT_PATH}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
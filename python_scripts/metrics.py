@@ -0,0 +1,199 @@
+import cProfile
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BASE_DIR = Path(__file__).resolve().parent
+# main.py points every script at the same report, standalone runs use the default
+REPORT_PATH = Path(os.environ.get("AIS_RUN_REPORT", BASE_DIR / "run_report.json"))
+# optional node_exporter textfile (e.g. /var/lib/node_exporter/ais_etl.prom)
+PROM_PATH = os.environ.get("AIS_PROM_TEXTFILE")
+# AIS_PROFILE=1 profiles every hook, AIS_PROFILE=trip_loop,chunk_loop only those
+PROFILE = os.environ.get("AIS_PROFILE", "")
+PROFILE_DIR = BASE_DIR / "profiles"
+
+
+def peak_rss_mb():
+    # high-water mark of the process, not the current usage
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports KB, macOS reports bytes
+    if sys.platform == "darwin":
+        return round(peak / 1024 / 1024, 2)
+    return round(peak / 1024, 2)
+
+
+class RunMetrics:
+    """Per-stage timings for one ETL script.
+
+    Stages nest ("load/read_csv"), every stage records wall time, rows,
+    rows/sec, peak RSS and the share of time spent inside io() blocks.
+    Everything outside io() is counted as compute.
+    """
+
+    def __init__(self, script_name):
+        self.script = script_name
+        self.started = time.time()
+        self.stages = {}
+        self.notes = {}
+        self._stack = []
+
+    def _current(self):
+        if not self._stack:
+            return None
+        return self.stages[self._stack[-1]]
+
+    @contextmanager
+    def stage(self, name):
+        full_name = "/".join(self._stack + [name])
+        st = self.stages.setdefault(full_name, {"seconds": 0.0, "io_seconds": 0.0, "rows": 0})
+        self._stack.append(full_name)
+        start = time.perf_counter()
+        try:
+            yield st
+        finally:
+            st["seconds"] += time.perf_counter() - start
+            st["peak_rss_mb"] = peak_rss_mb()
+            self._stack.pop()
+
+    @contextmanager
+    def io(self):
+        # time spent reading/writing files or talking to MongoDB
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            # counted on every open stage so parents include their children's I/O
+            for name in self._stack:
+                self.stages[name]["io_seconds"] += elapsed
+
+    def rows(self, n):
+        st = self._current()
+        if st is not None:
+            st["rows"] += int(n)
+
+    def record(self, name, seconds, rows=0, io=False):
+        # for hot loops where a context manager per iteration costs too much:
+        # time with perf_counter, accumulate locally, record once at the end
+        full_name = "/".join(self._stack + [name])
+        st = self.stages.setdefault(full_name, {"seconds": 0.0, "io_seconds": 0.0, "rows": 0})
+        st["seconds"] += seconds
+        st["rows"] += int(rows)
+        st["peak_rss_mb"] = peak_rss_mb()
+        if io:
+            st["io_seconds"] += seconds
+            for name in self._stack:
+                self.stages[name]["io_seconds"] += seconds
+
+    def note(self, key, value):
+        # free-form results (benchmarks, comparisons) kept next to the stages
+        self.notes[key] = value
+
+    @contextmanager
+    def profile(self, name):
+        # opt-in cProfile around a hot loop, output opens with snakeviz/pstats.
+        # py-spy needs no hook: `py-spy record -o out.svg -- python <script>`
+        wanted = [p.strip() for p in PROFILE.split(",") if p.strip()]
+        if not wanted or (PROFILE != "1" and name not in wanted):
+            yield
+            return
+        prof = cProfile.Profile()
+        prof.enable()
+        try:
+            yield
+        finally:
+            prof.disable()
+            PROFILE_DIR.mkdir(exist_ok=True)
+            out = PROFILE_DIR / f"{self.script}_{name}.prof"
+            prof.dump_stats(out)
+            print(f"Profile saved to {out}")
+
+    def summary(self):
+        stages = {}
+        for name, st in self.stages.items():
+            seconds = round(st["seconds"], 3)
+            io_seconds = round(min(st["io_seconds"], st["seconds"]), 3)
+            stages[name] = {
+                "seconds": seconds,
+                "io_seconds": io_seconds,
+                "compute_seconds": round(seconds - io_seconds, 3),
+                "rows": st["rows"],
+                "rows_per_sec": round(st["rows"] / st["seconds"], 1) if st["rows"] and st["seconds"] > 0 else None,
+                "peak_rss_mb": st.get("peak_rss_mb"),
+            }
+        summary = {
+            "started": self.started,
+            "seconds": round(time.time() - self.started, 3),
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": stages,
+        }
+        if self.notes:
+            summary["notes"] = self.notes
+        return summary
+
+    def finish(self):
+        # each script runs in its own process, so merge into the shared report
+        report = load_report()
+        report.setdefault("scripts", {})[self.script] = self.summary()
+        write_report(report)
+        print(f"Metrics written to {REPORT_PATH.name}")
+
+
+def load_report():
+    if REPORT_PATH.exists():
+        try:
+            with open(REPORT_PATH, "r") as f:
+                return json.load(f)
+        except ValueError:
+            pass
+    return {}
+
+
+def write_report(report):
+    tmp = REPORT_PATH.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp, REPORT_PATH)
+    if PROM_PATH:
+        write_prometheus(report, PROM_PATH)
+
+
+def write_prometheus(report, path):
+    # Prometheus text exposition format, written atomically for node_exporter
+    metrics = [
+        ("ais_etl_stage_seconds", "seconds", "Wall time per ETL stage."),
+        ("ais_etl_stage_io_seconds", "io_seconds", "Time spent in I/O per ETL stage."),
+        ("ais_etl_stage_compute_seconds", "compute_seconds", "Time spent outside I/O per ETL stage."),
+        ("ais_etl_stage_rows", "rows", "Rows processed per ETL stage."),
+        ("ais_etl_stage_rows_per_second", "rows_per_sec", "Throughput per ETL stage."),
+        ("ais_etl_stage_peak_rss_megabytes", "peak_rss_mb", "Process peak RSS at the end of the stage."),
+    ]
+    lines = []
+    for metric, key, help_text in metrics:
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} gauge")
+        for script, data in sorted(report.get("scripts", {}).items()):
+            for stage, st in sorted(data.get("stages", {}).items()):
+                if st.get(key) is None:
+                    continue
+                lines.append(f'{metric}{{script="{script}",stage="{stage}"}} {st[key]}')
+    lines.append("# HELP ais_etl_script_seconds Wall time per ETL script.")
+    lines.append("# TYPE ais_etl_script_seconds gauge")
+    for script, data in sorted(report.get("scripts", {}).items()):
+        lines.append(f'ais_etl_script_seconds{{script="{script}"}} {data.get("seconds", 0)}')
+
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp, path)
@@ -1,8 +1,20 @@
 import pandas as pd
+import numpy as np
 import json
 import os
 import ast
+import time
+import argparse
+import bson
 from pathlib import Path
+from metrics import RunMetrics
+from weather_with_dynamic2 import (STATIONS_JSON, WEATHER_JSON, get_cardinal, load_weather_index,
+                                   nearest_cells, weather_for_cells)
+
+run = RunMetrics("process_final_trips3")
+
+# synopsis critical points that start a new trip on their own
+SYNOPSIS_BREAKS = ("gap_end",)
 
 class RoundingEncoder(json.JSONEncoder):
     def iterencode(self, o, _one_shot=False):
@@ -35,95 +47,307 @@ def clean_annotations(val):
     except:
         return [str(val)]
 
-def reconstruct_trips_enriched(input_csv="dynamic_with_weather.csv", output_json="trips_ready.json"):
-    BASE_DIR = Path(__file__).resolve().parent
-    INPUT_PATH = BASE_DIR / input_csv
-    OUTPUT_PATH = BASE_DIR / output_json
-    STATIC_PATH = BASE_DIR / "static.csv"
-    if not INPUT_PATH.exists():
-        print(f"Error: {input_csv} not found!")
-        return
+def build_trip_points(group):
+    # hot loop: one point dict per AIS row (profile hook "trip_loop")
+    points = []
+    for row in group.itertuples():
+        # speed Filter (0-60 knots), because the dataset does not contain army vessels or speedboats
+        raw_speed = getattr(row, 'speed', 0.0)
+        clean_speed = clean_val(raw_speed, 2)
+        if clean_speed and clean_speed > 60:
+            clean_speed = 0.0
 
-    # Static data lookup
-    static_lookup = {}
-    if STATIC_PATH.exists():
-        static_lookup = pd.read_csv(STATIC_PATH).set_index('vessel_id').to_dict('index')
+        # wather Data (enforce 2 decimals)
+        weather = {}
+        weather_fields = ["temp_c", "wind_speed", "wind_dir", "humidity", "pressure", "visibility", "gust"]
+        for field in weather_fields:
+            val = getattr(row, field, None)
+            if pd.notnull(val):
+                weather[field] = clean_val(val, 2)
+        
+        if hasattr(row, 'wind_cardinal') and pd.notnull(row.wind_cardinal):
+            weather["wind_cardinal"] = row.wind_cardinal
 
-    # Load and sort data
-    df = pd.read_csv(INPUT_PATH, low_memory=False)
+        # build  each point with 5 decimals for GPS coordinates
+        p = {
+            "t": row.t.isoformat(),
+            "loc": {
+                "type": "Point",
+                "coordinates": [
+                    float(f"{float(row.lon):.5f}"), 
+                    float(f"{float(row.lat):.5f}")
+                ],
+                "cell_id": int(row.cell_id) if pd.notnull(row.cell_id) else None
+            },
+            "metrics": {
+                "speed": clean_speed,
+                "course": clean_val(row.course, 2),
+                "heading": int(row.heading) if pd.notnull(row.heading) and row.heading <= 360 else None,
+                "course_cardinal": getattr(row, 'course_cardinal', None)
+            },
+            "weather_data": weather,
+            "annotations": clean_annotations(getattr(row, 'annotations', []))
+        }
+        points.append(p)
+    return points
+
+def nullable(values, cast):
+    return [None if pd.isna(v) else cast(v) for v in values]
+
+def build_compact_points(group):
+    # compact schema: short names, parallel arrays, weather by (cell_id, slot) from weather_slots
+    t_sec = group['t'].values.astype('datetime64[s]').astype('int64')
+    # same rounding and rules as build_trip_points (speed over 60 knots -> 0, heading over 360 -> null)
+    speed = [clean_val(v, 2) for v in group['speed']]
+    speed = [0.0 if v and v > 60 else v for v in speed]
+    heading = pd.to_numeric(group['heading'], errors='coerce')
+    heading = heading.where(heading <= 360)
+    cells = pd.to_numeric(group['cell_id'], errors='coerce') if 'cell_id' in group.columns else pd.Series(np.nan, index=group.index)
+    # 3-hour slot start (unix seconds), same rounding as the weather lookup key
+    slots = pd.Series((np.round(t_sec / 10800) * 10800).astype('int64'), index=group.index).where(cells.notna())
+
+    fields = {
+        "start_time": group['t'].iloc[0].isoformat(),
+        "end_time": group['t'].iloc[-1].isoformat(),
+        "point_count": len(group),
+        "g": {"type": "MultiPoint", "coordinates": [[float(f"{float(x):.5f}"), float(f"{float(y):.5f}")]
+                                                    for x, y in zip(group['lon'], group['lat'])]},
+        "dt": (t_sec - t_sec[0]).tolist(),
+        "sp": speed,
+        "co": [clean_val(v, 2) for v in group['course']],
+        "hd": nullable(heading, int),
+        "c": nullable(cells, int),
+        "ws": nullable(slots, int),
+    }
+    # annotations are rare, kept sparse as [point index, annotations]
+    if 'annotations' in group.columns:
+        an = [[i, a] for i, a in enumerate(map(clean_annotations, group['annotations'])) if a]
+        if an:
+            fields["an"] = an
+    return fields
+
+def split_trips(df, break_annotations=()):
     df['t'] = pd.to_datetime(df['t'])
     df = df.sort_values(by=['vessel_id', 't']).reset_index(drop=True)
     
     # trip Splitting logic (120 minute gap), our modeling base
     df['time_diff'] = df.groupby('vessel_id')['t'].diff().dt.total_seconds() / 60
-    df['trip_id'] = ((df['vessel_id'] != df['vessel_id'].shift()) | (df['time_diff'] > 120)).cumsum()
+    breaks = (df['vessel_id'] != df['vessel_id'].shift()) | (df['time_diff'] > 120)
+    # synopses also mark communication gaps explicitly, a gap end opens a new trip
+    if break_annotations and 'annotations' in df.columns:
+        breaks |= df['annotations'].astype(str).str.contains('|'.join(break_annotations), na=False)
+    df['trip_id'] = breaks.cumsum()
+    return df
 
-    print(f"Processing {len(df):,} rows...")
-    if OUTPUT_PATH.exists():
-        OUTPUT_PATH.unlink()
+def load_static_lookup(static_path):
+    if not static_path.exists():
+        return {}
+    with run.stage("static_lookup"), run.io():
+        static_lookup = pd.read_csv(static_path).set_index('vessel_id').to_dict('index')
+        run.rows(len(static_lookup))
+    return static_lookup
+
+def write_trips(df, static_lookup, output_path, extra_fields=None, compact=False):
+    if output_path.exists():
+        output_path.unlink()
 
-    with open(OUTPUT_PATH, 'w', encoding='utf-8') as f:
+    build_s = encode_s = write_s = 0.0
+    trips_written = 0
+    with run.stage("build_trips"), run.profile("trip_loop"), open(output_path, 'w', encoding='utf-8') as f:
         for trip_id, group in df.groupby('trip_id'):
-            points = []
+            t0 = time.perf_counter()
             v_id = group.iloc[0]['vessel_id']
             v_static = static_lookup.get(v_id, {})
-
-            for row in group.itertuples():
-                # speed Filter (0-60 knots), because the dataset does not contain army vessels or speedboats
-                raw_speed = getattr(row, 'speed', 0.0)
-                clean_speed = clean_val(raw_speed, 2)
-                if clean_speed and clean_speed > 60:
-                    clean_speed = 0.0
-
-                # wather Data (enforce 2 decimals)
-                weather = {}
-                weather_fields = ["temp_c", "wind_speed", "wind_dir", "humidity", "pressure", "visibility", "gust"]
-                for field in weather_fields:
-                    val = getattr(row, field, None)
-                    if pd.notnull(val):
-                        weather[field] = clean_val(val, 2)
-                
-                if hasattr(row, 'wind_cardinal') and pd.notnull(row.wind_cardinal):
-                    weather["wind_cardinal"] = row.wind_cardinal
-
-                # build  each point with 5 decimals for GPS coordinates
-                p = {
-                    "t": row.t.isoformat(),
-                    "loc": {
-                        "type": "Point",
-                        "coordinates": [
-                            float(f"{float(row.lon):.5f}"), 
-                            float(f"{float(row.lat):.5f}")
-                        ],
-                        "cell_id": int(row.cell_id) if pd.notnull(row.cell_id) else None
-                    },
-                    "metrics": {
-                        "speed": clean_speed,
-                        "course": clean_val(row.course, 2),
-                        "heading": int(row.heading) if pd.notnull(row.heading) and row.heading <= 360 else None,
-                        "course_cardinal": getattr(row, 'course_cardinal', None)
-                    },
-                    "weather_data": weather,
-                    "annotations": clean_annotations(getattr(row, 'annotations', []))
-                }
-                points.append(p)
+            if compact:
+                fields = build_compact_points(group)
+            else:
+                points = build_trip_points(group)
+                fields = {"start_time": points[0]['t'], "end_time": points[-1]['t'], "point_count": len(points), "trajectory": points}
+            t1 = time.perf_counter()
+            build_s += t1 - t0
 
             # we save trip only if it contains multiple points (our rule)
-            if len(points) > 1:
+            if fields['point_count'] > 1:
                 doc = {
                     "trip_id": int(trip_id),
                     "vessel_id": str(v_id),
                     "country": v_static.get('country', 'Unknown'),
                     "shiptype": int(v_static.get('shiptype', 0)) if pd.notnull(v_static.get('shiptype', 0)) else 0,
                     "vessel_type_description": v_static.get('Description', 'N/A'),
-                    "start_time": points[0]['t'],
-                    "end_time": points[-1]['t'],
-                    "point_count": len(points),
-                    "trajectory": points
+                    **fields
                 }
-                f.write(json.dumps(doc, ensure_ascii=False, cls=RoundingEncoder) + '\n')
+                if extra_fields:
+                    doc.update(extra_fields.get(trip_id, {}))
+                line = json.dumps(doc, ensure_ascii=False, cls=RoundingEncoder) + '\n'
+                t2 = time.perf_counter()
+                f.write(line)
+                encode_s += t2 - t1
+                write_s += time.perf_counter() - t2
+                trips_written += 1
+        run.rows(len(df))
+        run.record("points", build_s, rows=len(df))
+        run.record("json_encode", encode_s, rows=trips_written)
+        run.record("write", write_s, rows=trips_written, io=True)
+    return trips_written
+
+def reconstruct_trips_enriched(input_csv="dynamic_with_weather.csv", output_json="trips_ready.json", compact=False):
+    BASE_DIR = Path(__file__).resolve().parent
+    INPUT_PATH = BASE_DIR / input_csv
+    OUTPUT_PATH = BASE_DIR / output_json
+    STATIC_PATH = BASE_DIR / "static.csv"
+    if not INPUT_PATH.exists():
+        print(f"Error: {input_csv} not found!")
+        return
+
+    # Static data lookup
+    static_lookup = load_static_lookup(STATIC_PATH)
+
+    # Load and sort data
+    with run.stage("read_csv"), run.io():
+        df = pd.read_csv(INPUT_PATH, low_memory=False)
+        run.rows(len(df))
+
+    with run.stage("split_trips"):
+        df = split_trips(df)
+        run.rows(len(df))
+
+    print(f"Processing {len(df):,} rows...")
+    write_trips(df, static_lookup, OUTPUT_PATH, compact=compact)
 
     print(f"SUCCESS: Trips reconstructed in {output_json}")
+    return OUTPUT_PATH
+
+def trip_ranges(df):
+    ranges = df.groupby('trip_id').agg(vessel_id=('vessel_id', 'first'), start=('t', 'min'), end=('t', 'max'), points=('t', 'size'))
+    return ranges.reset_index()
+
+def link_full_trips(syn_df, dynamic_path):
+    # full-resolution trips overlapping each synopsis trip (same vessel, overlapping time range)
+    with run.stage("read_dynamic"), run.io():
+        full_df = pd.read_csv(dynamic_path, usecols=['vessel_id', 't'])
+        run.rows(len(full_df))
+    full = trip_ranges(split_trips(full_df))
+    # single-point trips are never written by the full path
+    full = full[full['points'] > 1]
+    syn = trip_ranges(syn_df)
+
+    pairs = syn.merge(full, on='vessel_id', suffixes=('', '_full'))
+    pairs = pairs[(pairs['start_full'] <= pairs['end']) & (pairs['end_full'] >= pairs['start'])]
+    linked = pairs.groupby('trip_id')['trip_id_full'].apply(lambda ids: [int(i) for i in ids]).to_dict()
+    return {trip_id: {"full_trip_ids": ids} for trip_id, ids in linked.items()}
+
+def reconstruct_trips_synopsis(input_csv="dynamic_synopsis.csv", output_json="trips_synopsis.json",
+                               link_dynamic=False, dynamic_csv="dynamic_with_weather.csv", compact=False):
+    # trips from the synopsis points only: far fewer points, critical-point annotations kept
+    BASE_DIR = Path(__file__).resolve().parent
+    INPUT_PATH = BASE_DIR / input_csv
+    OUTPUT_PATH = BASE_DIR / output_json
+    STATIC_PATH = BASE_DIR / "static.csv"
+    if not INPUT_PATH.exists():
+        print(f"Error: {input_csv} not found!")
+        return
+
+    static_lookup = load_static_lookup(STATIC_PATH)
+
+    with run.stage("read_csv"), run.io():
+        df = pd.read_csv(INPUT_PATH, low_memory=False)
+        run.rows(len(df))
+
+    if 'annotation' in df.columns and 'annotations' not in df.columns:
+        df = df.rename(columns={'annotation': 'annotations'})
+    for col in ('speed', 'course', 'heading', 'annotations'):
+        if col not in df.columns:
+            df[col] = None
+
+    with run.stage("split_trips"):
+        df = split_trips(df, break_annotations=SYNOPSIS_BREAKS)
+        run.rows(len(df))
+
+    # same nearest-station weather as the full path
+    with run.stage("weather"):
+        if STATIONS_JSON.exists() and WEATHER_JSON.exists():
+            tree, station_ids, weather_data = load_weather_index()
+            t_sec = df['t'].values.astype('datetime64[s]').astype('int64')
+            cell_ids = nearest_cells(tree, station_ids, df['lon'].values, df['lat'].values)
+            weather_df = weather_for_cells(cell_ids, t_sec, weather_data, index=df.index)
+            df['cell_id'] = cell_ids
+            df = pd.concat([df, weather_df], axis=1)
+        else:
+            print("! Weather lookup not found, synopsis trips without weather")
+            df['cell_id'] = None
+        df['course_cardinal'] = df['course'].apply(get_cardinal)
+        run.rows(len(df))
+
+    extra_fields = {}
+    if link_dynamic:
+        if (BASE_DIR / dynamic_csv).exists():
+            with run.stage("link_dynamic"):
+                extra_fields = link_full_trips(df, BASE_DIR / dynamic_csv)
+        else:
+            print(f"! {dynamic_csv} not found, skipping links to full trips")
+
+    print(f"Processing {len(df):,} synopsis rows...")
+    write_trips(df, static_lookup, OUTPUT_PATH, extra_fields, compact=compact)
+
+    print(f"SUCCESS: Synopsis trips reconstructed in {output_json}")
+    return OUTPUT_PATH
+
+def trips_file_stats(path):
+    # BSON size is what the trips collection stores (collStats "size")
+    docs = points = bson_bytes = 0
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip(): continue
+            doc = json.loads(line)
+            docs += 1
+            points += doc['point_count']
+            bson_bytes += len(bson.encode(doc))
+    return {
+        "trips": docs,
+        "points": points,
+        "json_mb": round(path.stat().st_size / 1024 / 1024, 2),
+        "bson_mb": round(bson_bytes / 1024 / 1024, 2),
+        "avg_doc_kb": round(bson_bytes / docs / 1024, 2) if docs else 0,
+    }
+
+def compare_build_paths():
+    results = {}
+    for name, build in (("full", reconstruct_trips_enriched), ("synopsis", reconstruct_trips_synopsis)):
+        start = time.perf_counter()
+        with run.stage(name):
+            output = build()
+        elapsed = time.perf_counter() - start
+        if output is None:
+            continue
+        results[name] = {"build_seconds": round(elapsed, 2), **trips_file_stats(output)}
+
+    print("\nTrip build comparison")
+    print(f"{'path':<10}{'build s':>10}{'trips':>10}{'points':>12}{'json MB':>10}{'bson MB':>10}{'avg KB':>8}")
+    for name, r in results.items():
+        print(f"{name:<10}{r['build_seconds']:>10}{r['trips']:>10,}{r['points']:>12,}{r['json_mb']:>10}{r['bson_mb']:>10}{r['avg_doc_kb']:>8}")
+    if len(results) == 2 and results['synopsis']['build_seconds']:
+        print(f"Speedup: {results['full']['build_seconds'] / results['synopsis']['build_seconds']:.1f}x, "
+              f"size ratio: {results['synopsis']['bson_mb'] / max(results['full']['bson_mb'], 0.01):.2f}")
+    run.note("build_comparison", results)
+    return results
 
 if __name__ == "__main__":
-    reconstruct_trips_enriched()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Build trip documents")
+    parser.add_argument("--mode", choices=["full", "synopsis"], default="full")
+    parser.add_argument("--link-dynamic", action="store_true", help="synopsis mode: link to overlapping full-resolution trips")
+    parser.add_argument("--compare", action="store_true", help="build both paths and compare time and size")
+    parser.add_argument("--compact", action="store_true", help="compact point schema (parallel arrays, weather by cell/slot)")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare_build_paths()
+    elif args.mode == "synopsis":
+        if args.compact:
+            reconstruct_trips_synopsis(output_json="trips_synopsis_compact.json", link_dynamic=args.link_dynamic, compact=True)
+        else:
+            reconstruct_trips_synopsis(link_dynamic=args.link_dynamic)
+    elif args.compact:
+        reconstruct_trips_enriched(output_json="trips_compact.json", compact=True)
+    else:
+        reconstruct_trips_enriched()
+    run.finish()
@@ -1,6 +1,9 @@
 import pandas as pd
 import json
 import os
+from metrics import RunMetrics
+
+run = RunMetrics("process_vessels3")
 
 def process_static_data(output_file="vessels_ready.json"):
     input_file = "static.csv"
@@ -9,28 +12,34 @@ def process_static_data(output_file="vessels_ready.json"):
         print(f"Error: {input_file} not found!")
         return
 
-    df = pd.read_csv(input_file)
+    with run.stage("read_csv"), run.io():
+        df = pd.read_csv(input_file)
+        run.rows(len(df))
     print(f"Loaded {len(df)} static records.")
 
     vessels_list = []
     
-    for _, row in df.iterrows():
-        # create document for final collection  "vessels" to load after into mongodb
-        vessel_doc = {
-            "vessel_id": str(row['vessel_id']).strip(),
-            "country": str(row['country']) if pd.notnull(row['country']) else "Unknown", 
-            "type_info": {
-                "shiptype_code": int(row['shiptype']) if pd.notnull(row['shiptype']) else 0,
-                "description": str(row['Description']).strip() if pd.notnull(row['Description']) else "Unknown"
+    with run.stage("build_docs"):
+        for _, row in df.iterrows():
+            # create document for final collection  "vessels" to load after into mongodb
+            vessel_doc = {
+                "vessel_id": str(row['vessel_id']).strip(),
+                "country": str(row['country']) if pd.notnull(row['country']) else "Unknown", 
+                "type_info": {
+                    "shiptype_code": int(row['shiptype']) if pd.notnull(row['shiptype']) else 0,
+                    "description": str(row['Description']).strip() if pd.notnull(row['Description']) else "Unknown"
+                }
             }
-        }
-        vessels_list.append(vessel_doc)
+            vessels_list.append(vessel_doc)
+        run.rows(len(vessels_list))
 
-    with open(output_file, 'w', encoding='utf-8') as f:
+    with run.stage("write_json"), run.io(), open(output_file, 'w', encoding='utf-8') as f:
         for doc in vessels_list:
             f.write(json.dumps(doc) + '\n')
+        run.rows(len(vessels_list))
             
     print(f"Successfully saved {len(vessels_list)} vessels to {output_file}")
 
 if __name__ == "__main__":
-    process_static_data()
\ No newline at end of file
+    process_static_data()
+    run.finish()
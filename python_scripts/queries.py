@@ -0,0 +1,115 @@
+import argparse
+import time
+from datetime import datetime
+from pymongo import MongoClient
+from query_cache import QueryCache, is_empty_window, to_dt
+from config import MONGO_URI
+
+PORT_LAYER = "piraeus_port"
+# passenger (6x), cargo (7x) and tanker (8x) ship types count as large vessels
+LARGE_SHIPTYPES = list(range(60, 90))
+
+_port_geometries = {}
+
+def port_geometry(db, layer=PORT_LAYER):
+    if layer not in _port_geometries:
+        doc = db[layer].find_one({}, {"geometry": 1})
+        if doc is None:
+            raise ValueError(f"no geometry in '{layer}', run load_geodata4.py first")
+        _port_geometries[layer] = doc['geometry']
+    return _port_geometries[layer]
+
+def bucketed(db, ranges, point_match, output, extra_stages=()):
+    # one aggregation for contiguous ranges, one $bucket per range (times are ISO strings)
+    bounds = [to_dt(r[0]).isoformat() for r in ranges] + [to_dt(ranges[-1][1]).isoformat()]
+    lo, hi = bounds[0], bounds[-1]
+    # trip-level filter first, so the trip fields and the 2dsphere index narrow the trips to unwind
+    trip_match = {"start_time": {"$lt": hi}, "end_time": {"$gte": lo}}
+    trip_match.update({k: v for k, v in point_match.items() if not k.startswith("trajectory.") or k == "trajectory.loc"})
+    pipeline = [
+        {"$match": trip_match},
+        {"$unwind": "$trajectory"},
+        {"$match": {"trajectory.t": {"$gte": lo, "$lt": hi}, **point_match}},
+        *extra_stages,
+        {"$bucket": {"groupBy": "$trajectory.t", "boundaries": bounds, "output": output}},
+    ]
+    by_start = {b['_id']: b for b in db['trips'].aggregate(pipeline, allowDiskUse=True)}
+    return [by_start.get(b) for b in bounds[:-1]]
+
+# --- 1. spatio-temporal port activity: distinct vessels inside the port ---
+
+def port_activity_partials(ranges, db, port_layer=PORT_LAYER):
+    match = {"trajectory.loc": {"$geoWithin": {"$geometry": port_geometry(db, port_layer)}}}
+    buckets = bucketed(db, ranges, match, {"vessels": {"$addToSet": "$vessel_id"}})
+    # distinct counts do not add up across windows, so the partial is the vessel set
+    return [frozenset(b['vessels']) if b else frozenset() for b in buckets]
+
+def merge_port_activity(parts):
+    vessels = frozenset().union(*parts)
+    return {"vessel_count": len(vessels), "vessel_ids": sorted(vessels)}
+
+def port_activity(db, start, end, port_layer=PORT_LAYER, cache=None):
+    if is_empty_window(start, end):
+        return merge_port_activity([])
+    if cache is None:
+        return merge_port_activity(port_activity_partials([(start, end)], db, port_layer))
+    return cache.run("port_activity", lambda ranges, **p: port_activity_partials(ranges, db, **p),
+                     merge_port_activity, start, end, port_layer=port_layer)
+
+# --- 2. crosswind risk: large, slow vessels in port with strong wind across their course ---
+
+def crosswind_partials(ranges, db, port_layer=PORT_LAYER, max_speed=5.0, min_wind=8.0,
+                       min_angle=60.0, max_angle=120.0, shiptypes=tuple(LARGE_SHIPTYPES)):
+    match = {
+        "shiptype": {"$in": list(shiptypes)},
+        "trajectory.loc": {"$geoWithin": {"$geometry": port_geometry(db, port_layer)}},
+        "trajectory.metrics.speed": {"$lte": max_speed},
+        "trajectory.weather_data.wind_speed": {"$gte": min_wind},
+    }
+    # angle between course and wind direction, folded to 0-180 (wind from either side)
+    crosswind = [
+        {"$addFields": {"_angle": {"$mod": [{"$abs": {"$subtract": ["$trajectory.metrics.course", "$trajectory.weather_data.wind_dir"]}}, 180]}}},
+        {"$match": {"_angle": {"$gte": min_angle, "$lte": max_angle}}},
+    ]
+    output = {"events": {"$push": {
+        "vessel_id": "$vessel_id", "trip_id": "$trip_id", "t": "$trajectory.t",
+        "speed": "$trajectory.metrics.speed", "course": "$trajectory.metrics.course",
+        "wind_speed": "$trajectory.weather_data.wind_speed", "wind_dir": "$trajectory.weather_data.wind_dir",
+    }}}
+    buckets = bucketed(db, ranges, match, output, crosswind)
+    return [tuple(b['events']) if b else () for b in buckets]
+
+def merge_crosswind(parts):
+    events = sorted((e for part in parts for e in part), key=lambda e: (e['t'], e['vessel_id']))
+    return {"event_count": len(events), "vessel_count": len({e['vessel_id'] for e in events}), "events": events}
+
+def crosswind_risk(db, start, end, cache=None, **params):
+    if is_empty_window(start, end):
+        return merge_crosswind([])
+    if cache is None:
+        return merge_crosswind(crosswind_partials([(start, end)], db, **params))
+    return cache.run("crosswind_risk", lambda ranges, **p: crosswind_partials(ranges, db, **p),
+                     merge_crosswind, start, end, **params)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dashboard queries, optionally through the sub-window cache")
+    parser.add_argument("query", choices=["port_activity", "crosswind_risk"])
+    parser.add_argument("--start", required=True, type=datetime.fromisoformat)
+    parser.add_argument("--end", required=True, type=datetime.fromisoformat)
+    parser.add_argument("--repeat", type=int, default=3, help="run several times to see the cache at work")
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args()
+    if args.start > args.end:
+        parser.error("--start must not be after --end")
+
+    db = MongoClient(MONGO_URI)['piraeus_ais_db']
+    cache = None if args.no_cache else QueryCache(db)
+    fn = port_activity if args.query == "port_activity" else crosswind_risk
+    for i in range(args.repeat):
+        start = time.perf_counter()
+        result = fn(db, args.start, args.end, cache=cache)
+        elapsed = (time.perf_counter() - start) * 1000
+        summary = {k: v for k, v in result.items() if isinstance(v, int)}
+        print(f"run {i + 1}: {summary} in {elapsed:.1f} ms")
+    if cache is not None:
+        print(f"cache: {cache.stats}, {len(cache.entries):,} entries, {cache.bytes / 1024:.0f} KB")
@@ -0,0 +1,190 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+# queries are split on this grid, aligned to midnight
+SUB_WINDOW = timedelta(hours=1)
+MAX_BYTES = 64 * 1024 * 1024
+# how often a cache looks for invalidations written by other processes (loaders)
+SYNC_EVERY_S = 5
+INVALIDATIONS = "cache_invalidations"
+
+def to_dt(value):
+    # trip times are ISO strings (trips_ready.json), accept datetimes too
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def is_empty_window(start, end):
+    # [start, end) with start == end is empty; a reversed window is a caller error
+    start, end = to_dt(start), to_dt(end)
+    if start > end:
+        raise ValueError(f"window start {start.isoformat()} is after its end {end.isoformat()}")
+    return start == end
+
+def align_down(t, step=SUB_WINDOW):
+    day = t.replace(hour=0, minute=0, second=0, microsecond=0)
+    return day + ((t - day) // step) * step
+
+def split_window(start, end, step=SUB_WINDOW):
+    """[start, end) -> (head, aligned sub-windows, tail); head/tail are None when aligned."""
+    start, end = to_dt(start), to_dt(end)
+    first = align_down(start, step)
+    if first < start:
+        first += step
+    last = align_down(end, step)
+    if first >= last:
+        # shorter than one sub-window, nothing to reuse
+        return (start, end), [], None
+    head = (start, first) if start < first else None
+    tail = (last, end) if last < end else None
+    subs = []
+    t = first
+    while t < last:
+        subs.append((t, t + step))
+        t += step
+    return head, subs, tail
+
+def windows_touching(start, end, step=SUB_WINDOW):
+    # sub-window starts overlapped by [start, end] (inclusive end: a point at end counts)
+    t, end = align_down(to_dt(start), step), to_dt(end)
+    keys = []
+    while t <= end:
+        keys.append(t.isoformat())
+        t += step
+    return keys
+
+def mark_windows_dirty(db, window_keys):
+    # called by the loaders; caches in other processes pick it up on their next sync
+    if not window_keys:
+        return
+    from pymongo import UpdateOne
+    now = datetime.now(timezone.utc)
+    ops = [UpdateOne({"_id": k}, {"$set": {"updated": now}, "$inc": {"epoch": 1}}, upsert=True) for k in window_keys]
+    db[INVALIDATIONS].bulk_write(ops, ordered=False)
+
+class QueryCache:
+    """LRU of per-sub-window partial results with a memory cap.
+
+    Keys are (query name, normalised params, sub-window start). A query over
+    [start, end) reuses every cached aligned sub-window it covers; only the
+    missing ones and the unaligned edges hit MongoDB.
+    """
+
+    def __init__(self, db=None, max_bytes=MAX_BYTES, step=SUB_WINDOW):
+        self.db = db
+        self.max_bytes = max_bytes
+        self.step = step
+        self.entries = OrderedDict()  # key -> (value, size)
+        self.by_window = {}  # window start iso -> set of keys
+        self.bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "edges": 0, "evictions": 0, "invalidated": 0}
+        self._lock = threading.Lock()
+        self._last_sync = 0.0
+        self._seen = datetime.now(timezone.utc)
+
+    @staticmethod
+    def normalise(params):
+        # order-insensitive, hashable; lists/sets become sorted tuples
+        def norm(v):
+            if isinstance(v, (list, tuple, set, frozenset)):
+                return tuple(sorted(norm(x) for x in v))
+            if isinstance(v, float):
+                return round(v, 6)
+            return v
+        return tuple(sorted((k, norm(v)) for k, v in params.items() if v is not None))
+
+    def _get(self, key):
+        with self._lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return True, self.entries[key][0]
+            self.stats["misses"] += 1
+            return False, None
+
+    def _put(self, key, value):
+        size = len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self.entries:
+                self._drop(key)
+            self.entries[key] = (value, size)
+            self.by_window.setdefault(key[2], set()).add(key)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self._drop(next(iter(self.entries)))
+                self.stats["evictions"] += 1
+
+    def _drop(self, key):
+        _, size = self.entries.pop(key)
+        self.bytes -= size
+        keys = self.by_window.get(key[2])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.by_window[key[2]]
+
+    def invalidate(self, start, end):
+        # only the sub-windows overlapping [start, end] are dropped
+        self.invalidate_windows(windows_touching(start, end, self.step))
+
+    def invalidate_windows(self, window_keys):
+        with self._lock:
+            for w in window_keys:
+                for key in list(self.by_window.get(w, ())):
+                    self._drop(key)
+                    self.stats["invalidated"] += 1
+
+    def sync(self, force=False):
+        if self.db is None or (not force and time.time() - self._last_sync < SYNC_EVERY_S):
+            return
+        self._last_sync = time.time()
+        changed = list(self.db[INVALIDATIONS].find({"updated": {"$gt": self._seen}}, {"updated": 1}))
+        if changed:
+            self._seen = max(d['updated'] for d in changed).replace(tzinfo=timezone.utc)
+            self.invalidate_windows([d['_id'] for d in changed])
+
+    def run(self, name, partial_fn, merge_fn, start, end, **params):
+        """partial_fn(ranges, **params) gets contiguous [start, end) ranges and returns
+        one exact partial per range; merge_fn(list of partials) builds the result."""
+        if is_empty_window(start, end):
+            # $bucket needs strictly ascending boundaries, nothing to ask MongoDB
+            return merge_fn([])
+        self.sync()
+        pkey = self.normalise(params)
+        head, subs, tail = split_window(start, end, self.step)
+
+        # (range, cache key or None for the unaligned edges), in time order
+        plan = ([(head, None)] if head else []) + [((s, e), (name, pkey, s.isoformat())) for s, e in subs] + ([(tail, None)] if tail else [])
+        parts = [None] * len(plan)
+        missing = []
+        for i, (rng, key) in enumerate(plan):
+            if key is None:
+                self.stats["edges"] += 1
+            else:
+                found, value = self._get(key)
+                if found:
+                    parts[i] = value
+                    continue
+            missing.append(i)
+
+        # contiguous runs of missing ranges go to MongoDB as one query each
+        runs = []
+        for i in missing:
+            if runs and runs[-1][-1] == i - 1:
+                runs[-1].append(i)
+            else:
+                runs.append([i])
+        for run_rows in runs:
+            values = partial_fn([plan[i][0] for i in run_rows], **params)
+            for i, value in zip(run_rows, values):
+                parts[i] = value
+                if plan[i][1] is not None:
+                    self._put(plan[i][1], value)
+        return merge_fn(parts)
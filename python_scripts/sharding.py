@@ -0,0 +1,187 @@
+import json
+import os
+import re
+import time
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from bson import MinKey
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+from query_cache import mark_windows_dirty, windows_touching
+
+# "hashed": {vessel_id: hashed}, even writes, vessel lookups hit one shard
+# "ranged": {vessel_id: 1, start_time: 1}, one vessel's trips stay together in time order
+SHARD_KEY = os.environ.get("AIS_TRIPS_SHARD_KEY", "hashed")
+CHUNKS_PER_SHARD = 4
+# top-level vessel_id of a trips line, it comes before the trajectory so the match stops early
+VESSEL_ID_RE = re.compile(r'"vessel_id":\s*"((?:[^"\\]|\\.)*)"')
+
+SHARD_KEYS = {
+    "hashed": {"vessel_id": "hashed"},
+    "ranged": {"vessel_id": 1, "start_time": 1},
+}
+
+def is_mongos(client):
+    # mongos answers hello with msg "isdbgrid"
+    return client.admin.command("hello").get("msg") == "isdbgrid"
+
+def list_shards(client):
+    return [s["_id"] for s in client.admin.command("listShards")["shards"]]
+
+def vessel_split_points(path, n_chunks):
+    # quantiles of the vessel_ids in the trips file, so every chunk gets a similar share
+    # regex instead of json.loads: no need to parse every trajectory just for the ids
+    vessels = set()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            m = VESSEL_ID_RE.search(line)
+            if m:
+                vessels.add(json.loads(f'"{m.group(1)}"'))
+    vessels = sorted(vessels)
+    if len(vessels) < n_chunks:
+        return vessels[1:]
+    return [vessels[i * len(vessels) // n_chunks] for i in range(1, n_chunks)]
+
+def shard_trips(client, db_name, coll_name="trips", key=SHARD_KEY, trips_path=None):
+    # shard the (empty) trips collection and pre-split it before the bulk load
+    ns = f"{db_name}.{coll_name}"
+    shards = list_shards(client)
+    n_chunks = max(len(shards) * CHUNKS_PER_SHARD, 1)
+    client.admin.command("enableSharding", db_name)
+
+    if key == "hashed":
+        # hashed keys pre-split and spread the initial chunks by themselves
+        client.admin.command("shardCollection", ns, key=SHARD_KEYS[key], numInitialChunks=n_chunks)
+    else:
+        client.admin.command("shardCollection", ns, key=SHARD_KEYS[key])
+        if trips_path and os.path.exists(trips_path):
+            points = vessel_split_points(trips_path, n_chunks)
+            for vessel_id in points:
+                client.admin.command("split", ns, middle={"vessel_id": vessel_id, "start_time": MinKey()})
+            # round-robin the ranges over the shards, no waiting for the balancer
+            for i, vessel_id in enumerate([""] + points):
+                target = shards[i % len(shards)]
+                try:
+                    client.admin.command("moveChunk", ns, find={"vessel_id": vessel_id, "start_time": MinKey()}, to=target)
+                except Exception as e:
+                    # already on the target shard
+                    if "already" not in str(e):
+                        raise
+    print(f"Sharded {ns} on {SHARD_KEYS[key]} over {len(shards)} shard(s)")
+
+class ShardRouter:
+    """Client-side copy of the chunk table, used to group insert batches by shard.
+
+    Only an optimisation: if a chunk moves during the load, mongos still routes
+    the documents correctly, the batch just spans two shards.
+    """
+
+    def __init__(self, client, db_name, coll_name="trips"):
+        self.db = client[db_name]
+        config = client['config']
+        coll = config.collections.find_one({"_id": f"{db_name}.{coll_name}"})
+        if coll is None:
+            raise ValueError(f"{db_name}.{coll_name} is not sharded")
+        self.fields = list(coll['key'].keys())
+        self.hashed = "hashed" in coll['key'].values()
+        chunks = list(config.chunks.find({"uuid": coll['uuid']}).sort("min", 1))
+        self.bounds = [tuple(c['min'][f] for f in self.fields) for c in chunks]
+        self.shards = [c['shard'] for c in chunks]
+        self._hashes = {}
+
+    def _hash_values(self, values):
+        # MongoDB's own hash of the shard key value, computed server-side once per vessel
+        missing = [v for v in set(values) if v not in self._hashes]
+        for i in range(0, len(missing), 10000):
+            docs = [{"v": v} for v in missing[i:i + 10000]]
+            pipeline = [{"$documents": docs}, {"$project": {"_id": 0, "v": 1, "h": {"$convertShardKeyToHashed": "$v"}}}]
+            for r in self.db.aggregate(pipeline):
+                self._hashes[r['v']] = r['h']
+
+    def shard_for(self, doc):
+        if self.hashed:
+            key = (self._hashes[doc[self.fields[0]]],)
+        else:
+            key = tuple(doc.get(f) for f in self.fields)
+        return self.shards[bisect_right(self.bounds, key) - 1]
+
+    def group(self, docs):
+        if self.hashed:
+            self._hash_values([d[self.fields[0]] for d in docs])
+        groups = {}
+        for d in docs:
+            groups.setdefault(self.shard_for(d), []).append(d)
+        return groups
+
+def insert_batch(collection, docs):
+    # same tolerance as load_trips on a single node: bad documents are counted, not fatal
+    try:
+        return len(collection.insert_many(docs, ordered=False).inserted_ids), 0
+    except BulkWriteError as e:
+        return e.details['nInserted'], len(e.details['writeErrors'])
+    except PyMongoError:
+        # fallback if the batch fails as a whole
+        inserted = rejected = 0
+        for d in docs:
+            try:
+                collection.insert_one(d)
+                inserted += 1
+            except DuplicateKeyError:
+                # already written before the batch failed
+                inserted += 1
+            except PyMongoError:
+                rejected += 1
+        return inserted, rejected
+
+def insert_by_shard(collection, router, docs, pool, pending):
+    # one insert_many per shard, one batch in flight per shard
+    inserted = rejected = 0
+    for shard, batch in router.group(docs).items():
+        prev = pending.get(shard)
+        if prev is not None:
+            i, r = prev.result()
+            inserted += i
+            rejected += r
+        pending[shard] = pool.submit(insert_batch, collection, batch)
+    return inserted, rejected
+
+def load_trips_by_shard(db, path, collection_name, router, chunk_size=5000, run=None):
+    collection = db[collection_name]
+    print(f"\nLoading {collection_name} grouped by shard ({len(set(router.shards))} shards)...")
+    t_count = 0
+    rejected_count = 0
+    start = time.perf_counter()
+    chunk = []
+    pending = {}
+    touched = set()
+    with ThreadPoolExecutor(max_workers=max(len(set(router.shards)), 1)) as pool, open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip(): continue
+            try:
+                doc = json.loads(line)
+                doc.pop('_id', None)
+                touched.update(windows_touching(doc['start_time'], doc['end_time']))
+            except Exception as e:
+                print(f"Skip line error: {e}")
+                continue
+            chunk.append(doc)
+            if len(chunk) >= chunk_size:
+                inserted, rejected = insert_by_shard(collection, router, chunk, pool, pending)
+                t_count += inserted
+                rejected_count += rejected
+                chunk = []
+                print(f"Progress: {t_count:,} {collection_name} inserted...")
+        if chunk:
+            inserted, rejected = insert_by_shard(collection, router, chunk, pool, pending)
+            t_count += inserted
+            rejected_count += rejected
+        for future in pending.values():
+            inserted, rejected = future.result()
+            t_count += inserted
+            rejected_count += rejected
+    elapsed = time.perf_counter() - start
+    if collection_name == 'trips':
+        mark_windows_dirty(db, touched)
+    if run is not None:
+        run.record(f"{collection_name}/insert_by_shard", elapsed, rows=t_count, io=True)
+    print(f"FINISH: {t_count:,} inserted, {rejected_count:,} rejected in {elapsed:.1f}s.")
+    return t_count
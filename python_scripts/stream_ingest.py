@@ -0,0 +1,466 @@
+import argparse
+import json
+import queue
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+import pandas as pd
+from pymongo import MongoClient, UpdateOne, DeleteOne, ASCENDING
+from pymongo.errors import AutoReconnect, ConnectionFailure, NetworkTimeout, NotPrimaryError
+from metrics import RunMetrics
+from config import MONGO_URI
+from weather_with_dynamic2 import STATIONS_JSON, WEATHER_JSON, get_cardinal, load_weather_index, nearest_cells, weather_for_cells
+from process_final_trips3 import build_trip_points
+from query_cache import mark_windows_dirty, windows_touching
+
+run = RunMetrics("stream_ingest")
+
+# column order of the unipi_ais_dynamic CSV rows, used when the feed has no header
+DEFAULT_COLUMNS = ("t", "vessel_id", "lon", "lat", "heading", "speed", "course")
+TRIP_GAP_MIN = 120  # same split rule as process_final_trips3.py
+STATS_EVERY_S = 10
+# an open trip rolls over to a new trip_id at this size (~400 B per point, far below the 16 MB document limit)
+MAX_TRIP_POINTS = 10000
+# wait between retries of a failed flush, doubled up to the max
+RETRY_BACKOFF_S = 1.0
+MAX_BACKOFF_S = 30.0
+MAX_FLUSH_RETRIES = 10
+# only connection problems are retried, any other flush error would fail again
+RETRYABLE_ERRORS = (AutoReconnect, NetworkTimeout, ConnectionFailure, NotPrimaryError)
+# batches that cannot be written, one message per line (replayable with --file --from-start)
+DEAD_LETTER = STATIONS_JSON.parent / "stream_dead_letter.jsonl"
+
+# --- sources: every source yields raw text lines until stop is set ---
+
+def tail_file(path, stop, from_start=False):
+    # follow a growing CSV/JSON-lines file like `tail -f`
+    with open(path, 'r', encoding='utf-8') as f:
+        if not from_start:
+            f.seek(0, 2)
+        buf = ""
+        while not stop.is_set():
+            chunk = f.readline()
+            if not chunk:
+                time.sleep(0.2)
+                continue
+            buf += chunk
+            if buf.endswith('\n'):
+                yield buf
+                buf = ""
+
+def socket_lines(host, port, stop):
+    # line-based TCP feed (stand-in for an NMEA/AIS-catcher forwarder), reconnects on drop
+    while not stop.is_set():
+        try:
+            with socket.create_connection((host, port), timeout=5) as sock:
+                sock.settimeout(1.0)
+                print(f"Connected to {host}:{port}")
+                buf = b""
+                while not stop.is_set():
+                    try:
+                        data = sock.recv(65536)
+                    except socket.timeout:
+                        continue
+                    if not data:
+                        break
+                    buf += data
+                    *lines, buf = buf.split(b"\n")
+                    for line in lines:
+                        yield line.decode('utf-8', errors='replace') + "\n"
+        except OSError as e:
+            print(f"! Feed {host}:{port} unavailable ({e}), retrying...")
+            time.sleep(2)
+
+# --- cleaning: the per-message version of clean_dynamic1.py's rules ---
+
+def parse_line(line, columns):
+    line = line.strip()
+    if not line:
+        return None
+    if line.startswith('{'):
+        return json.loads(line)
+    values = line.split(',')
+    if len(values) != len(columns):
+        return None
+    return dict(zip(columns, values))
+
+def to_float(val):
+    try:
+        if val is None or val == "":
+            return None
+        return float(val)
+    except (TypeError, ValueError):
+        return None
+
+def clean_message(msg):
+    # returns a cleaned dict or None if the message is rejected
+    t_ms = to_float(msg.get('t'))
+    lon, lat = to_float(msg.get('lon')), to_float(msg.get('lat'))
+    vessel_id = str(msg.get('vessel_id', '')).strip()
+    if t_ms is None or lon is None or lat is None or not vessel_id:
+        return None
+
+    # Heading 511 is N/A in AIS, set to null
+    heading = to_float(msg.get('heading'))
+    if heading == 511:
+        heading = None
+
+    # Rules: Speed 0-60 knots, Course 0-360 degrees
+    # (missing values fail the range check, as in the batch filter)
+    speed, course = to_float(msg.get('speed')), to_float(msg.get('course'))
+    if speed is None or not 0.0 <= speed <= 60.0:
+        return None
+    if course is None or not 0.0 <= course <= 360.0:
+        return None
+
+    return {
+        "t": pd.Timestamp(int(t_ms), unit='ms'),
+        "vessel_id": vessel_id,
+        # GPS to 5 decimals, metrics to 2 decimals
+        "lon": round(lon, 5),
+        "lat": round(lat, 5),
+        "heading": round(heading, 2) if heading is not None else None,
+        "speed": round(speed, 2),
+        "course": round(course, 2),
+    }
+
+# --- trip state and MongoDB writes ---
+
+class TripWriter:
+    """Keeps the open trip of every vessel and appends points with batched $push updates."""
+
+    def __init__(self, db, static_lookup, weather_index=None):
+        self.db = db
+        self.trips = db['trips']
+        self.static_lookup = static_lookup
+        self.weather_index = weather_index
+        self.open_trips = {}  # vessel_id -> {"trip_id", "start_time", "last_t", "points", "written"}
+        self.max_event_t = None
+        self.stats = {"points": 0, "late": 0, "trips_opened": 0, "trips_closed": 0, "trips_rolled": 0,
+                      "flushes": 0, "flush_seconds": 0.0, "failed_flushes": 0,
+                      "dead_letter_batches": 0, "dead_letter_points": 0}
+
+        self.trips.create_index([("trip_id", ASCENDING)])
+        self.trips.create_index([("status", ASCENDING), ("vessel_id", ASCENDING)])
+        last = self.trips.find_one(sort=[("trip_id", -1)], projection={"trip_id": 1})
+        self.next_trip_id = int(last['trip_id']) + 1 if last else 1
+
+        # resume trips that were still open when the service stopped
+        for doc in self.trips.find({"status": "open"}, {"trip_id": 1, "vessel_id": 1, "start_time": 1, "end_time": 1, "point_count": 1}):
+            self.open_trips[doc['vessel_id']] = {
+                "trip_id": doc['trip_id'],
+                "start_time": doc['start_time'],
+                "last_t": pd.Timestamp(doc['end_time']),
+                "points": doc.get('point_count', 0),
+                "written": doc.get('point_count', 0),
+            }
+        if self.open_trips:
+            print(f"Resumed {len(self.open_trips):,} open trips")
+
+    def _enrich(self, df):
+        if self.weather_index is not None:
+            tree, station_ids, weather_data = self.weather_index
+            t_sec = df['t'].values.astype('datetime64[s]').astype('int64')
+            cell_ids = nearest_cells(tree, station_ids, df['lon'].values, df['lat'].values)
+            df['cell_id'] = cell_ids
+            df = pd.concat([df, weather_for_cells(cell_ids, t_sec, weather_data, index=df.index)], axis=1)
+        else:
+            df['cell_id'] = None
+        df['course_cardinal'] = df['course'].apply(get_cardinal)
+        return df
+
+    @staticmethod
+    def _trip_filter(vessel_id, state):
+        # carries the full shard key (hashed vessel_id or vessel_id+start_time), so
+        # upserts stay single-shard when trips is sharded (see sharding.py)
+        return {"vessel_id": vessel_id, "start_time": state['start_time'], "trip_id": state['trip_id']}
+
+    def _close(self, vessel_id, ops):
+        state = self.open_trips.pop(vessel_id)
+        # same rule as the batch path: single-point trips are not kept
+        if state['points'] > 1:
+            ops.append(UpdateOne(self._trip_filter(vessel_id, state), {"$set": {"status": "closed"}}))
+        else:
+            ops.append(DeleteOne(self._trip_filter(vessel_id, state)))
+        self.stats["trips_closed"] += 1
+
+    def _open(self, vessel_id, t):
+        # same string as the first point's "t" (build_trip_points uses isoformat)
+        self.open_trips[vessel_id] = {"trip_id": self.next_trip_id, "start_time": t.isoformat(), "last_t": t, "points": 0, "written": 0}
+        self.next_trip_id += 1
+        self.stats["trips_opened"] += 1
+
+    def _snapshot(self):
+        return {v: dict(s) for v, s in self.open_trips.items()}, self.next_trip_id, self.max_event_t, dict(self.stats)
+
+    def _restore(self, snapshot):
+        open_trips, self.next_trip_id, self.max_event_t, stats = snapshot
+        self.open_trips = open_trips
+        self.stats = {**stats, "failed_flushes": self.stats["failed_flushes"] + 1}
+
+    def _append_op(self, v_id, trip, pts):
+        if trip['written'] == 0:
+            # first write of the trip: insert-only, a retried flush finds it and does nothing
+            v_static = self.static_lookup.get(v_id, {})
+            return UpdateOne(
+                self._trip_filter(v_id, trip),
+                {"$setOnInsert": {
+                    "country": v_static.get('country', 'Unknown'),
+                    "shiptype": int(v_static.get('shiptype', 0)) if pd.notnull(v_static.get('shiptype', 0)) else 0,
+                    "vessel_type_description": v_static.get('Description', 'N/A'),
+                    "end_time": pts[-1]['t'],
+                    "point_count": len(pts),
+                    "status": "open",
+                    "trajectory": pts,
+                }},
+                upsert=True,
+            )
+        # later writes only match while the points are not there yet, so a retried $push is a no-op
+        return UpdateOne(
+            {**self._trip_filter(v_id, trip), "end_time": {"$lt": pts[0]['t']}},
+            {
+                "$push": {"trajectory": {"$each": pts}},
+                "$inc": {"point_count": len(pts)},
+                "$set": {"end_time": pts[-1]['t'], "status": "open"},
+            },
+        )
+
+    def write(self, messages):
+        """Appends a batch. On a write error the trip state is rolled back and the
+        error raised, so the caller can retry the same batch later."""
+        snapshot = self._snapshot()
+        try:
+            self._write(messages)
+        except Exception:
+            self._restore(snapshot)
+            raise
+
+    def _write(self, messages):
+        start = time.perf_counter()
+        ops = []
+        closes = []
+        accepted = []
+        trip_of = []
+        touched = set()
+        for msg in messages:
+            v_id, t = msg['vessel_id'], msg['t']
+            state = self.open_trips.get(v_id)
+            if state is not None and t <= state['last_t']:
+                # duplicate or out of order for this vessel (batch keeps the first per vessel_id,t)
+                self.stats["late"] += 1
+                continue
+            if state is not None and (t - state['last_t']).total_seconds() / 60 > TRIP_GAP_MIN:
+                self._close(v_id, closes)
+                state = None
+            elif state is not None and state['points'] >= MAX_TRIP_POINTS:
+                # vessels that never go silent (moored, reporting) would outgrow the document limit
+                self._close(v_id, closes)
+                self.stats["trips_rolled"] += 1
+                state = None
+            if state is None:
+                self._open(v_id, t)
+                state = self.open_trips[v_id]
+            state['last_t'] = t
+            state['points'] += 1
+            accepted.append(msg)
+            trip_of.append(state)
+            if self.max_event_t is None or t > self.max_event_t:
+                self.max_event_t = t
+
+        if accepted:
+            df = self._enrich(pd.DataFrame(accepted))
+            points = build_trip_points(df)
+            grouped = {}
+            for trip, msg, point in zip(trip_of, accepted, points):
+                grouped.setdefault(trip['trip_id'], (msg['vessel_id'], trip, []))[2].append(point)
+
+            for v_id, trip, pts in grouped.values():
+                touched.update(windows_touching(pts[0]['t'], pts[-1]['t']))
+                ops.append(self._append_op(v_id, trip, pts))
+                trip['written'] += len(pts)
+
+        # vessels silent for more than the gap (by feed time) close their trip
+        if self.max_event_t is not None:
+            for v_id in [v for v, s in self.open_trips.items()
+                         if (self.max_event_t - s['last_t']).total_seconds() / 60 > TRIP_GAP_MIN]:
+                self._close(v_id, closes)
+
+        # closes go last: a trip opened and closed within this batch needs its upsert first
+        ops.extend(closes)
+        if ops:
+            # every op is idempotent, a batch that failed halfway can be written again
+            self.trips.bulk_write(ops, ordered=True)
+            # dashboards drop only the cached sub-windows these points fall into
+            mark_windows_dirty(self.db, touched)
+        elapsed = time.perf_counter() - start
+        self.stats["points"] += len(accepted)
+        self.stats["flushes"] += 1
+        self.stats["flush_seconds"] += elapsed
+        run.record("flush", elapsed, rows=len(accepted), io=True)
+
+    def close_all(self):
+        ops = []
+        for v_id in list(self.open_trips):
+            state = self.open_trips[v_id]
+            # only single-point trips are dropped on shutdown, the rest stay open for resume
+            if state['points'] <= 1:
+                self._close(v_id, ops)
+        if ops:
+            self.trips.bulk_write(ops, ordered=True)
+
+# --- service ---
+
+def reader(lines, out_q, stop, counters, columns):
+    # parse + clean on the reader thread; put() blocks when the writer falls behind (backpressure)
+    for line in lines:
+        if stop.is_set():
+            break
+        counters["received"] += 1
+        fields = line.strip().split(',')
+        if 't' in fields and 'vessel_id' in fields:
+            columns = tuple(fields)  # CSV header gives the column order
+            continue
+        try:
+            msg = parse_line(line, columns)
+        except ValueError:
+            msg = None
+        msg = clean_message(msg) if msg is not None else None
+        if msg is None:
+            counters["rejected"] += 1
+            continue
+        start = time.perf_counter()
+        out_q.put(msg)
+        counters["blocked_seconds"] += time.perf_counter() - start
+    stop.set()
+
+def print_stats(counters, writer, out_q, started, last):
+    now = time.time()
+    elapsed = now - last["time"]
+    rate = (writer.stats["points"] - last["points"]) / elapsed if elapsed > 0 else 0
+    lag = None
+    if writer.max_event_t is not None:
+        lag = (datetime.now(timezone.utc).replace(tzinfo=None) - writer.max_event_t.to_pydatetime()).total_seconds()
+    avg_flush = writer.stats["flush_seconds"] / writer.stats["flushes"] * 1000 if writer.stats["flushes"] else 0
+    print(f"[{now - started:,.0f}s] recv {counters['received']:,} | rejected {counters['rejected']:,} | "
+          f"late {writer.stats['late']:,} | written {writer.stats['points']:,} ({rate:,.0f} pts/s) | "
+          f"queue {out_q.qsize():,}/{out_q.maxsize:,} | blocked {counters['blocked_seconds']:.1f}s | "
+          f"open trips {len(writer.open_trips):,} | flush {avg_flush:.1f} ms" +
+          (f" | dead letter {writer.stats['dead_letter_points']:,}" if writer.stats['dead_letter_points'] else "") +
+          (f" | feed lag {lag:,.0f}s" if lag is not None else ""))
+    last["time"], last["points"] = now, writer.stats["points"]
+
+def dead_letter(writer, batch, error, path=DEAD_LETTER):
+    # the writer state was rolled back, so the batch is simply dropped from the stream
+    with open(path, 'a', encoding='utf-8') as f:
+        for msg in batch:
+            # t back to epoch ms, the feed format clean_message expects
+            f.write(json.dumps({**msg, "t": msg['t'].value // 10**6, "error": repr(error)}) + '\n')
+    writer.stats["dead_letter_batches"] += 1
+    writer.stats["dead_letter_points"] += len(batch)
+    print(f"! {len(batch):,} points moved to {path.name} ({error!r})")
+
+def run_service(lines, batch_size=500, flush_interval=1.0, queue_size=10000, columns=DEFAULT_COLUMNS):
+    client = MongoClient(MONGO_URI)
+    db = client['piraeus_ais_db']
+
+    static_lookup = {}
+    static_path = STATIONS_JSON.parent / "static.csv"
+    if static_path.exists():
+        static_lookup = pd.read_csv(static_path).set_index('vessel_id').to_dict('index')
+    weather_index = None
+    if STATIONS_JSON.exists() and WEATHER_JSON.exists():
+        weather_index = load_weather_index()
+    else:
+        print("! Weather lookup not found, points are stored without weather")
+
+    writer = TripWriter(db, static_lookup, weather_index)
+    out_q = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    counters = {"received": 0, "rejected": 0, "blocked_seconds": 0.0}
+    t = threading.Thread(target=reader, args=(lines, out_q, stop, counters, columns), daemon=True)
+    t.start()
+
+    started = time.time()
+    last = {"time": started, "points": 0}
+    batch = []
+    backoff = RETRY_BACKOFF_S
+    retries = 0
+    deadline = time.time() + flush_interval
+    print("Streaming ingest running (Ctrl+C to stop)...")
+    try:
+        while not (stop.is_set() and out_q.empty()):
+            # a batch waiting for a retry is not grown, the reader blocks on the full queue instead
+            if not retries and len(batch) < batch_size:
+                try:
+                    batch.append(out_q.get(timeout=0.1))
+                except queue.Empty:
+                    pass
+            # flush on size or time, whichever comes first
+            if batch and (retries or len(batch) >= batch_size or time.time() >= deadline):
+                try:
+                    writer.write(batch)
+                    batch = []
+                    retries = 0
+                    backoff = RETRY_BACKOFF_S
+                except RETRYABLE_ERRORS as e:
+                    retries += 1
+                    if retries > MAX_FLUSH_RETRIES:
+                        dead_letter(writer, batch, e)
+                        batch, retries, backoff = [], 0, RETRY_BACKOFF_S
+                    else:
+                        print(f"! Flush of {len(batch):,} points failed ({e}), retry {retries}/{MAX_FLUSH_RETRIES} in {backoff:.0f}s")
+                        time.sleep(backoff)
+                        backoff = min(backoff * 2, MAX_BACKOFF_S)
+                except Exception as e:
+                    # bad document, validation, too large, encoding or enrichment error: retrying will not help
+                    dead_letter(writer, batch, e)
+                    batch, retries, backoff = [], 0, RETRY_BACKOFF_S
+            if time.time() >= deadline:
+                deadline = time.time() + flush_interval
+            if time.time() - last["time"] >= STATS_EVERY_S:
+                print_stats(counters, writer, out_q, started, last)
+    except KeyboardInterrupt:
+        print("\nStopping...")
+        stop.set()
+        # drain what is already queued
+        while not out_q.empty():
+            batch.append(out_q.get_nowait())
+    finally:
+        if batch:
+            try:
+                writer.write(batch)
+            except Exception as e:
+                dead_letter(writer, batch, e)
+        try:
+            writer.close_all()
+        except Exception as e:
+            print(f"! Closing single-point trips failed ({e!r}), they are resumed on the next start")
+        print_stats(counters, writer, out_q, started, last)
+        run.note("stream", {**counters, **writer.stats, "seconds": round(time.time() - started, 1)})
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Near-real-time AIS ingest into the trips collection")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--file", help="CSV or JSON-lines file to follow")
+    source.add_argument("--socket", help="HOST:PORT of a line-based AIS feed")
+    parser.add_argument("--from-start", action="store_true", help="read the file from the beginning, not only new lines")
+    parser.add_argument("--columns", default=",".join(DEFAULT_COLUMNS), help="CSV column order when the feed has no header")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--flush-interval", type=float, default=1.0)
+    parser.add_argument("--queue-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    stop_source = threading.Event()
+    columns = tuple(c.strip() for c in args.columns.split(","))
+    if args.file:
+        lines = tail_file(args.file, stop_source, from_start=args.from_start)
+    else:
+        host, port = args.socket.rsplit(":", 1)
+        lines = socket_lines(host, int(port), stop_source)
+
+    try:
+        run_service(lines, args.batch_size, args.flush_interval, args.queue_size, columns)
+    finally:
+        stop_source.set()
+        run.finish()
@@ -0,0 +1,244 @@
+import argparse
+import heapq
+import json
+import time
+from pathlib import Path
+import numpy as np
+
+BASE_DIR = Path(__file__).resolve().parent
+TRIPS_JSON = BASE_DIR / "trips_ready.json"
+INDEX_PATH = BASE_DIR / "trajectory_index.npz"
+
+# every trip becomes a signature of N_POINTS points, evenly spaced along its path
+N_POINTS = 32
+# grid cell size of the start-point index
+CELL_KM = 2.0
+# DTW warping window (Sakoe-Chiba band) in signature points
+DTW_WINDOW = 4
+# local equirectangular projection around Piraeus, distances in km
+LON0, LAT0 = 23.6, 37.94
+KM_PER_DEG_LAT = 110.574
+KM_PER_DEG_LON = 111.320 * np.cos(np.radians(LAT0))
+
+def project(coords):
+    coords = np.asarray(coords, dtype=np.float64)
+    return np.column_stack([(coords[:, 0] - LON0) * KM_PER_DEG_LON, (coords[:, 1] - LAT0) * KM_PER_DEG_LAT])
+
+def resample(xy, n=N_POINTS):
+    # fixed-length signature: n points at equal arc-length steps
+    steps = np.linalg.norm(np.diff(xy, axis=0), axis=1)
+    dist = np.concatenate([[0.0], np.cumsum(steps)])
+    if dist[-1] == 0:
+        return np.repeat(xy[:1], n, axis=0)
+    targets = np.linspace(0, dist[-1], n)
+    return np.column_stack([np.interp(targets, dist, xy[:, 0]), np.interp(targets, dist, xy[:, 1])])
+
+def signature(trajectory):
+    # trajectory: the "trajectory" array of a trip document
+    coords = [p['loc']['coordinates'] for p in trajectory if p.get('loc')]
+    return resample(project(coords))
+
+def cell_key(cx, cy):
+    # one sortable int per grid cell (cell coordinates stay far below 2**20)
+    return (np.asarray(cx, dtype=np.int64) + 2**20) * 2**21 + (np.asarray(cy, dtype=np.int64) + 2**20)
+
+def cells_of(xy):
+    return np.floor(xy / CELL_KM).astype(np.int64)
+
+# --- distances ---
+
+def dtw(a, b, window=DTW_WINDOW):
+    # DTW with squared-euclidean point cost inside the band, sqrt at the end (km)
+    n = len(a)
+    cost = ((a[:, None, :] - b[None, :, :]) ** 2).sum(axis=2)
+    acc = np.full((n + 1, n + 1), np.inf)
+    acc[0, 0] = 0.0
+    for i in range(1, n + 1):
+        lo, hi = max(1, i - window), min(n, i + window)
+        for j in range(lo, hi + 1):
+            acc[i, j] = cost[i - 1, j - 1] + min(acc[i - 1, j], acc[i, j - 1], acc[i - 1, j - 1])
+    return float(np.sqrt(acc[n, n]))
+
+def frechet(a, b):
+    # discrete Frechet distance (km)
+    n, m = len(a), len(b)
+    d = np.linalg.norm(a[:, None, :] - b[None, :, :], axis=2)
+    ca = np.empty((n, m))
+    ca[0, 0] = d[0, 0]
+    for i in range(1, n):
+        ca[i, 0] = max(ca[i - 1, 0], d[i, 0])
+    for j in range(1, m):
+        ca[0, j] = max(ca[0, j - 1], d[0, j])
+    for i in range(1, n):
+        for j in range(1, m):
+            ca[i, j] = max(min(ca[i - 1, j], ca[i - 1, j - 1], ca[i, j - 1]), d[i, j])
+    return float(ca[n - 1, m - 1])
+
+# --- lower bounds, vectorised over all candidates ---
+
+def lb_endpoints(query, sigs):
+    # both measures must match first-to-first and last-to-last
+    d_first = np.linalg.norm(sigs[:, 0] - query[0], axis=1)
+    d_last = np.linalg.norm(sigs[:, -1] - query[-1], axis=1)
+    return d_first, d_last
+
+def lb_keogh(query, sigs, window=DTW_WINDOW):
+    # distance of every candidate point to the query's band envelope, per axis
+    n = len(query)
+    upper = np.empty_like(query)
+    lower = np.empty_like(query)
+    for i in range(n):
+        lo, hi = max(0, i - window), min(n, i + window + 1)
+        upper[i] = query[lo:hi].max(axis=0)
+        lower[i] = query[lo:hi].min(axis=0)
+    above = np.clip(sigs - upper, 0, None)
+    below = np.clip(lower - sigs, 0, None)
+    return np.sqrt(((above + below) ** 2).sum(axis=(1, 2)))
+
+class TrajectoryIndex:
+    """On-disk index of trip signatures with a grid on the start point.
+
+    Rows are sorted by start cell, so the candidates near a query start are a
+    few contiguous slices (searchsorted), not a scan of the whole index.
+    """
+
+    def __init__(self, trip_ids, vessel_ids, sigs):
+        start_keys = cell_key(*cells_of(sigs[:, 0]).T)
+        order = np.argsort(start_keys, kind='stable')
+        self.trip_ids = np.asarray(trip_ids)[order]
+        self.vessel_ids = np.asarray(vessel_ids)[order]
+        self.sigs = np.asarray(sigs, dtype=np.float32)[order]
+        self.start_keys = start_keys[order]
+
+    @classmethod
+    def build(cls, trips):
+        trip_ids, vessel_ids, sigs = [], [], []
+        for doc in trips:
+            if doc.get('point_count', 0) < 2:
+                continue
+            trip_ids.append(doc['trip_id'])
+            vessel_ids.append(doc['vessel_id'])
+            sigs.append(signature(doc['trajectory']))
+        return cls(trip_ids, vessel_ids, np.array(sigs).reshape(-1, N_POINTS, 2))
+
+    def save(self, path=INDEX_PATH):
+        np.savez_compressed(path, trip_ids=self.trip_ids, vessel_ids=self.vessel_ids, sigs=self.sigs,
+                            meta=np.array([N_POINTS, CELL_KM, LON0, LAT0]))
+
+    @classmethod
+    def load(cls, path=INDEX_PATH):
+        data = np.load(path, allow_pickle=False)
+        n_points, cell_km = int(data['meta'][0]), float(data['meta'][1])
+        if n_points != N_POINTS or cell_km != CELL_KM:
+            raise ValueError(f"{path} was built with N_POINTS={n_points}, CELL_KM={cell_km}, rebuild it")
+        return cls(data['trip_ids'], data['vessel_ids'], data['sigs'])
+
+    def __len__(self):
+        return len(self.trip_ids)
+
+    def signature_of(self, trip_id):
+        rows = np.nonzero(self.trip_ids == trip_id)[0]
+        if not len(rows):
+            raise KeyError(f"trip {trip_id} is not in the index")
+        return self.sigs[rows[0]].astype(np.float64)
+
+    def candidates(self, query, radius_km=None):
+        if radius_km is None:
+            return np.arange(len(self))
+        # grid cells around the query start, each one a contiguous slice of the sorted keys
+        r = int(np.ceil(radius_km / CELL_KM))
+        cx, cy = cells_of(query[0])
+        rows = []
+        for dx in range(-r, r + 1):
+            keys = cell_key(np.full(2 * r + 1, cx + dx), np.arange(cy - r, cy + r + 1))
+            lo = np.searchsorted(self.start_keys, keys, side='left')
+            hi = np.searchsorted(self.start_keys, keys, side='right')
+            rows.extend(np.arange(a, b) for a, b in zip(lo, hi) if b > a)
+        if not rows:
+            return np.empty(0, dtype=np.int64)
+        # the cell square reaches past the radius in the corners, keep only true distances
+        rows = np.concatenate(rows)
+        return rows[np.linalg.norm(self.sigs[rows, 0] - query[0], axis=1) <= radius_km]
+
+    def top_k(self, query, k=10, measure="dtw", radius_km=None, exclude=None):
+        """Exact top-k under DTW or discrete Frechet among the candidates.
+
+        Candidates are visited in lower-bound order and the search stops as
+        soon as the next lower bound exceeds the current k-th best distance.
+        """
+        stats = {"candidates": 0, "exact": 0}
+        rows = self.candidates(query, radius_km)
+        if exclude is not None:
+            rows = rows[self.trip_ids[rows] != exclude]
+        stats["candidates"] = len(rows)
+        if not len(rows):
+            return [], stats
+
+        sigs = self.sigs[rows].astype(np.float64)
+        d_first, d_last = lb_endpoints(query, sigs)
+        if measure == "dtw":
+            # DTW sums point costs: both endpoint costs and the envelope bound apply
+            lb = np.maximum(np.sqrt(d_first ** 2 + d_last ** 2), lb_keogh(query, sigs))
+            dist_fn = dtw
+        elif measure == "frechet":
+            lb = np.maximum(d_first, d_last)
+            dist_fn = frechet
+        else:
+            raise ValueError(f"unknown measure: {measure}")
+
+        best = []  # max-heap of (-distance, row)
+        for i in np.argsort(lb, kind='stable'):
+            if len(best) == k and lb[i] >= -best[0][0]:
+                break
+            d = dist_fn(query, sigs[i])
+            stats["exact"] += 1
+            if len(best) < k:
+                heapq.heappush(best, (-d, i))
+            elif d < -best[0][0]:
+                heapq.heapreplace(best, (-d, i))
+
+        results = [{"trip_id": int(self.trip_ids[rows[i]]), "vessel_id": str(self.vessel_ids[rows[i]]), "distance_km": round(-nd, 3)}
+                   for nd, i in sorted(best, reverse=True)]
+        return results, stats
+
+def read_trips(path=TRIPS_JSON):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def read_trips_mongo(collection_name="trips"):
+    from pymongo import MongoClient
+    from config import MONGO_URI
+    client = MongoClient(MONGO_URI)
+    projection = {"_id": 0, "trip_id": 1, "vessel_id": 1, "point_count": 1, "trajectory.loc.coordinates": 1}
+    return client['piraeus_ais_db'][collection_name].find({}, projection)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Trajectory similarity index (top-k by DTW / discrete Frechet)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("build", help="build the index from trips_ready.json or MongoDB")
+    b.add_argument("--from-mongo", metavar="COLLECTION", help="read trips from this collection instead of the JSON file")
+    q = sub.add_parser("query", help="trips most similar to a given trip")
+    q.add_argument("--trip-id", type=int, required=True)
+    q.add_argument("--k", type=int, default=10)
+    q.add_argument("--measure", choices=["dtw", "frechet"], default="dtw")
+    q.add_argument("--radius-km", type=float, help="only trips starting within this distance (grid lookup)")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = time.perf_counter()
+        trips = read_trips_mongo(args.from_mongo) if args.from_mongo else read_trips()
+        index = TrajectoryIndex.build(trips)
+        index.save()
+        print(f"Indexed {len(index):,} trips in {time.perf_counter() - start:.1f}s -> {INDEX_PATH.name}")
+    else:
+        index = TrajectoryIndex.load()
+        query = index.signature_of(args.trip_id)
+        start = time.perf_counter()
+        results, stats = index.top_k(query, args.k, args.measure, args.radius_km, exclude=args.trip_id)
+        elapsed = (time.perf_counter() - start) * 1000
+        for rank, r in enumerate(results, 1):
+            print(f"{rank:>3}. trip {r['trip_id']:>8}  vessel {r['vessel_id'][:12]}  {r['distance_km']:.3f} km")
+        print(f"{stats['exact']:,} exact distances for {stats['candidates']:,} candidates "
+              f"(index {len(index):,} trips) in {elapsed:.1f} ms")
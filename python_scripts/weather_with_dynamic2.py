@@ -4,8 +4,12 @@ import json
 import os
 import gc
 import numpy as np
+import time
 from pathlib import Path
 from scipy.spatial import cKDTree
+from metrics import RunMetrics
+
+run = RunMetrics("weather_with_dynamic2")
 
 
 BASE_DIR = Path(__file__).resolve().parent
@@ -49,7 +53,9 @@ def process_weather_shapes():
             print(f"! Missing: {path.name}")
             continue
         print(f"-> Loading shapefile: {path.name}")
-        gdf_tmp = gpd.read_file(path)
+        with run.stage("read_shapefiles"), run.io():
+            gdf_tmp = gpd.read_file(path)
+            run.rows(len(gdf_tmp))
         if gdf_tmp.crs != "EPSG:4326":
             gdf_tmp = gdf_tmp.to_crs(epsg=4326)
         parts.append(gdf_tmp)
@@ -63,92 +69,139 @@ def process_weather_shapes():
     gc.collect()
 
     # identify unique stations based on coordinates
-    gdf['coord_key'] = gdf.geometry.apply(lambda g: f"{g.x:.5f}_{g.y:.5f}")
-    unique_stations = gdf.drop_duplicates(subset=['coord_key']).copy()
-    unique_stations['cell_id'] = range(len(unique_stations))
-    
-    # save station info for spatial joining later
-    stations_list = [{"cell_id": int(r.cell_id), "lon": float(f"{r.geometry.x:.5f}"), "lat": float(f"{r.geometry.y:.5f}")} 
-                     for r in unique_stations.itertuples()]
-    
-    with open(STATIONS_JSON, "w") as f: json.dump(stations_list, f)
+    with run.stage("stations"):
+        gdf['coord_key'] = gdf.geometry.apply(lambda g: f"{g.x:.5f}_{g.y:.5f}")
+        unique_stations = gdf.drop_duplicates(subset=['coord_key']).copy()
+        unique_stations['cell_id'] = range(len(unique_stations))
+        run.rows(len(gdf))
+        
+        # save station info for spatial joining later
+        stations_list = [{"cell_id": int(r.cell_id), "lon": float(f"{r.geometry.x:.5f}"), "lat": float(f"{r.geometry.y:.5f}")} 
+                         for r in unique_stations.itertuples()]
+        
+        with run.io(), open(STATIONS_JSON, "w") as f: json.dump(stations_list, f)
 
     # build weather lookup dictionary
     coord_to_id = unique_stations.set_index('coord_key')['cell_id'].to_dict()
     gdf['cell_id'] = gdf['coord_key'].map(coord_to_id)
 
     weather_lookup = {}
-    for row in gdf.itertuples():
-        ts = getattr(row, 'timestamp_', None)
-        if pd.isna(ts): continue
-        
-        # Round time to nearest 3-hour interval (NOAA standard)
-        ts_aligned = int(np.round(ts / 10800) * 10800)
-        key = f"{int(row.cell_id)}_{ts_aligned}"
-        
-        weather_lookup[key] = {"temp_c": round(float(row.TMP) - 273.15, 2) if pd.notnull(getattr(row, 'TMP', None)) else None,"wind_speed": round(float(row.WSPD), 2) if pd.notnull(getattr(row, 'WSPD', None)) else None,
-            "wind_dir": round(float(row.WDIRMET), 2) if pd.notnull(getattr(row, 'WDIRMET', None)) else None,"visibility": round(float(row.VIS), 2) if pd.notnull(getattr(row, 'VIS', None)) else None,
-            "pressure": round(float(row.PRMSL)/100, 2) if pd.notnull(getattr(row, 'PRMSL', None)) else None,
-            "humidity": round(float(row.RH), 2) if pd.notnull(getattr(row, 'RH', None)) else None,"gust": round(float(row.GUST), 2) if pd.notnull(getattr(row, 'GUST', None)) else None}
+    with run.stage("weather_lookup"):
+        for row in gdf.itertuples():
+            ts = getattr(row, 'timestamp_', None)
+            if pd.isna(ts): continue
+            
+            # Round time to nearest 3-hour interval (NOAA standard)
+            ts_aligned = int(np.round(ts / 10800) * 10800)
+            key = f"{int(row.cell_id)}_{ts_aligned}"
+            
+            weather_lookup[key] = {"temp_c": round(float(row.TMP) - 273.15, 2) if pd.notnull(getattr(row, 'TMP', None)) else None,"wind_speed": round(float(row.WSPD), 2) if pd.notnull(getattr(row, 'WSPD', None)) else None,
+                "wind_dir": round(float(row.WDIRMET), 2) if pd.notnull(getattr(row, 'WDIRMET', None)) else None,"visibility": round(float(row.VIS), 2) if pd.notnull(getattr(row, 'VIS', None)) else None,
+                "pressure": round(float(row.PRMSL)/100, 2) if pd.notnull(getattr(row, 'PRMSL', None)) else None,
+                "humidity": round(float(row.RH), 2) if pd.notnull(getattr(row, 'RH', None)) else None,"gust": round(float(row.GUST), 2) if pd.notnull(getattr(row, 'GUST', None)) else None}
+        run.rows(len(gdf))
 
-    with open(WEATHER_JSON, "w") as f:json.dump(weather_lookup, f)
+        with run.io(), open(WEATHER_JSON, "w") as f:json.dump(weather_lookup, f)
         
     print(f"Weather lookup ready ({len(weather_lookup):,} records)")
     return True
 
-def merge_weather_with_dynamic():
-    #enrich the dynamic AIS data with weather based on location and time
-    cleanup_files([OUTPUT_CSV])
-    
+def load_weather_index():
+    # stations tree + weather lookup, also used by the synopsis trip path
     with open(STATIONS_JSON, "r") as f: stations = json.load(f)
     with open(WEATHER_JSON, "r") as f: weather_data = json.load(f)
 
     # Use cKDTree for fast nearest-neighbor search (stations)
     tree = cKDTree(np.array([[s['lon'], s['lat']] for s in stations]))
     station_ids = np.array([s['cell_id'] for s in stations])
+    return tree, station_ids, weather_data
+
+def nearest_cells(tree, station_ids, lons, lats):
+    _, indices = tree.query(np.column_stack([lons, lats]))
+    return station_ids[indices]
+
+def weather_for_cells(cell_ids, t_sec, weather_data, index=None):
+    # Round time to nearest 3-hour interval, same key as the weather lookup
+    ts_rounded = (np.round(t_sec / 10800) * 10800).astype('int64')
+    lookup_keys = cell_ids.astype(str) + "_" + ts_rounded.astype(str)
+    
+    # Map weather data
+    weather_df = pd.DataFrame(pd.Series(lookup_keys).map(weather_data).tolist(), index=index)
+    if 'wind_dir' in weather_df.columns:
+        weather_df['wind_cardinal'] = weather_df['wind_dir'].apply(get_cardinal)
+    return weather_df
+
+def merge_weather_with_dynamic():
+    #enrich the dynamic AIS data with weather based on location and time
+    cleanup_files([OUTPUT_CSV])
+    
+    with run.stage("load_lookups"), run.io():
+        tree, station_ids, weather_data = load_weather_index()
+        run.rows(len(weather_data))
 
     chunk_size = 500000
     is_first = True
-    for i, df in enumerate(pd.read_csv(DYNAMIC_CSV, chunksize=chunk_size)):
-        # Calculate time and spatial keys
-        t_sec = pd.to_datetime(df['t']).values.astype('datetime64[s]').astype('int64')
-        _, indices = tree.query(df[['lon', 'lat']].values)
-        
-        ts_rounded = (np.round(t_sec / 10800) * 10800).astype('int64')
-        lookup_keys = station_ids[indices].astype(str) + "_" + ts_rounded.astype(str)
-        
-        # Map weather data
-        weather_df = pd.DataFrame(pd.Series(lookup_keys).map(weather_data).tolist(), index=df.index)
-        
-        # Add cardinals
-        if 'wind_dir' in weather_df.columns:
-            weather_df['wind_cardinal'] = weather_df['wind_dir'].apply(get_cardinal)
-        if 'course' in df.columns:
-            df['course_cardinal'] = df['course'].apply(get_cardinal)
-        
-        df['cell_id'] = station_ids[indices]
-        final_df = pd.concat([df, weather_df], axis=1)
-
-        # Strict string formatting for CSV export
-        gps_cols = ['lat', 'lon']
-        for col in gps_cols:
-            final_df[col] = final_df[col].apply(lambda x: f"{float(x):.5f}" if pd.notnull(x) else "")
+    # hot loop (profile hook "chunk_loop"), every sub-step is timed separately
+    timings = {"read_csv": 0.0, "kdtree_query": 0.0, "weather_map": 0.0, "format": 0.0, "write_csv": 0.0}
+    total_rows = 0
+    with run.stage("merge"), run.profile("chunk_loop"):
+        reader = iter(pd.read_csv(DYNAMIC_CSV, chunksize=chunk_size))
+        i = 0
+        while True:
+            t0 = time.perf_counter()
+            df = next(reader, None)
+            timings["read_csv"] += time.perf_counter() - t0
+            if df is None:
+                break
+            total_rows += len(df)
+
+            # Calculate time and spatial keys
+            t0 = time.perf_counter()
+            t_sec = pd.to_datetime(df['t']).values.astype('datetime64[s]').astype('int64')
+            cell_ids = nearest_cells(tree, station_ids, df['lon'].values, df['lat'].values)
+            timings["kdtree_query"] += time.perf_counter() - t0
             
-        float_cols = ['speed', 'course', 'temp_c', 'pressure', 'wind_speed', 'humidity', 'visibility', 'gust', 'wind_dir']
-        for col in float_cols:
-            if col in final_df.columns:
-                final_df[col] = final_df[col].apply(lambda x: f"{float(x):.2f}" if pd.notnull(x) else "")
-
-        # Save chunk
-        mode, header = ('w', True) if is_first else ('a', False)
-        final_df.to_csv(OUTPUT_CSV, index=False, mode=mode, header=header)
-        
-        is_first = False
-        print(f"Chunk {i+1} processed...")
-        gc.collect()
+            t0 = time.perf_counter()
+            weather_df = weather_for_cells(cell_ids, t_sec, weather_data, index=df.index)
+            
+            # Add cardinals
+            if 'course' in df.columns:
+                df['course_cardinal'] = df['course'].apply(get_cardinal)
+            
+            df['cell_id'] = cell_ids
+            final_df = pd.concat([df, weather_df], axis=1)
+            timings["weather_map"] += time.perf_counter() - t0
+
+            # Strict string formatting for CSV export
+            t0 = time.perf_counter()
+            gps_cols = ['lat', 'lon']
+            for col in gps_cols:
+                final_df[col] = final_df[col].apply(lambda x: f"{float(x):.5f}" if pd.notnull(x) else "")
+                
+            float_cols = ['speed', 'course', 'temp_c', 'pressure', 'wind_speed', 'humidity', 'visibility', 'gust', 'wind_dir']
+            for col in float_cols:
+                if col in final_df.columns:
+                    final_df[col] = final_df[col].apply(lambda x: f"{float(x):.2f}" if pd.notnull(x) else "")
+            timings["format"] += time.perf_counter() - t0
+
+            # Save chunk
+            t0 = time.perf_counter()
+            mode, header = ('w', True) if is_first else ('a', False)
+            final_df.to_csv(OUTPUT_CSV, index=False, mode=mode, header=header)
+            timings["write_csv"] += time.perf_counter() - t0
+            
+            is_first = False
+            i += 1
+            print(f"Chunk {i} processed...")
+            gc.collect()
+
+        run.rows(total_rows)
+        for name, seconds in timings.items():
+            run.record(name, seconds, rows=total_rows, io=name in ("read_csv", "write_csv"))
 
     print(f"\nSUCCESS: Data saved to {OUTPUT_CSV.name}")
 
 if __name__ == "__main__":
     if process_weather_shapes():
-        merge_weather_with_dynamic()
\ No newline at end of file
+        merge_weather_with_dynamic()
+    run.finish()